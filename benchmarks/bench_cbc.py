@@ -0,0 +1,74 @@
+"""Throughput of CBC encryption and decryption, native vs. reference
+
+Run from the repository root:
+
+    python -m benchmarks.bench_cbc [SIZE_MB ...] [--reference-limit MB]
+        [--workers N]
+
+The hand-rolled reference implementation is only timed up to
+--reference-limit megabytes, beyond that it takes too long. With
+--workers, threaded decryption is timed as well.
+"""
+import argparse
+import secrets
+import time
+
+import block_crypt as bc
+
+_MB = 1 << 20
+
+
+def _throughput(function, size):
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    return size / _MB / elapsed
+
+
+def _bench_size(size_mb, with_reference, workers=None):
+    key = secrets.token_bytes(16)
+    iv = secrets.token_bytes(16)
+    size = size_mb * _MB
+    plaintext = secrets.token_bytes(size - 1)
+    ciphertext = bc.cbc_encrypt(key, iv, plaintext)
+    rates = {
+        "encrypt": _throughput(
+            lambda: bc.cbc_encrypt(key, iv, plaintext), size),
+        "decrypt": _throughput(
+            lambda: bc.cbc_decrypt(key, iv, ciphertext), size),
+    }
+    if workers:
+        rates["decrypt parallel"] = _throughput(
+            lambda: bc.cbc_decrypt(key, iv, ciphertext, workers=workers),
+            size)
+    if with_reference:
+        rates["encrypt reference"] = _throughput(
+            lambda: bc.cbc_encrypt(key, iv, plaintext, reference=True), size)
+        rates["decrypt reference"] = _throughput(
+            lambda: bc.cbc_decrypt(key, iv, ciphertext, reference=True), size)
+    return rates
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sizes", nargs="*", type=int, default=[1, 16, 256],
+                        help="payload sizes in MB, up to 1024")
+    parser.add_argument("--reference-limit", type=int, default=4,
+                        help="largest size in MB to time the reference on")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="threads for parallel decryption")
+    args = parser.parse_args(args)
+    for size_mb in args.sizes:
+        rates = _bench_size(
+            size_mb, size_mb <= args.reference_limit, args.workers)
+        for name, rate in rates.items():
+            print("{:5d} MB  {:18s} {:10.1f} MB/s".format(size_mb, name, rate))
+        for direction in ["encrypt", "decrypt"]:
+            reference = rates.get(direction + " reference")
+            if reference:
+                print("{:5d} MB  {:18s} {:10.0f}x".format(
+                    size_mb, direction + " speedup", rates[direction] / reference))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,76 @@
 __all__ = [
+    "BlockView",
+    "PackedBlobs",
+    "as_byte_view",
+    "join_into",
+    "output_view",
+    "write_output",
     "xor_pairs",
     "byte_from_int",
     "get_block",
     "hamming_distance",
+    "hamming_matrix",
     "brake_into_keysize_blocks"
 ]
 
-from math import ceil
+from collections.abc import Sequence
+
+
+def as_byte_view(blob):
+    """View a bytes-like object as unsigned bytes, copying only non-buffers"""
+    try:
+        return memoryview(blob).cast("B")
+    except TypeError:
+        # Not a (contiguous) buffer, e.g. a list of byte values
+        return memoryview(bytes(iter(blob)))
+
+
+def output_view(out, length):
+    """
+    Writable view of the first length bytes of the buffer out
+
+    Functions taking an out= argument write their result there instead of
+    returning new bytes. Unless they say otherwise, out must not overlap
+    their inputs. They may use out as scratch space, e.g. ecb_encrypt and
+    cbc_encrypt pad the plaintext into it and then encrypt it in place.
+    """
+    view = memoryview(out).cast("B")
+    if view.readonly:
+        raise TypeError("Output buffer must be writable")
+    if len(view) < length:
+        raise ValueError("Output buffer too small")
+    return view[:length]
+
+
+def write_output(blob, out):
+    """
+    blob itself if out is None, otherwise copy blob to the start of out and
+    return a view of the copy
+    """
+    if out is None:
+        return blob
+    view = output_view(out, len(blob))
+    view[:] = blob
+    return view
+
+
+def join_into(buffer, parts):
+    """
+    Write parts back to back into the bytearray buffer, growing but never
+    shrinking it, so repeated joins reuse its memory
+
+    :return: Writable view of the joined parts
+    """
+    parts = [as_byte_view(part) for part in parts]
+    length = sum(len(part) for part in parts)
+    if len(buffer) < length:
+        buffer.extend(bytes(length - len(buffer)))
+    view = memoryview(buffer)[:length]
+    position = 0
+    for part in parts:
+        view[position:position + len(part)] = part
+        position += len(part)
+    return view
 
 
 def xor_pairs(pairs):
@@ -19,33 +83,144 @@ def byte_from_int(int_):
     return int_.to_bytes(1, byteorder="big")
 
 
+def _popcount(int_):
+    return bin(int_).count("1")
+
+
 def _single_byte_hamming_distance(pair):
-    distance = 0
     left, right = pair
     if left >= 256 or right >= 256:
         raise ValueError("Not a byte")
     if left < 0 or right < 0:
         raise ValueError("Not an (unsigned) byte")
-    for ii in range(8):
-        mask = 1 << ii
-        if (mask & left) != (mask & right):
-            distance += 1
-    return distance
+    return _popcount(left ^ right)
 
 
 def hamming_distance(left, right):
     """Hamming distance between two equal length bytes objects"""
     if len(left) != len(right):
         raise ValueError("Blobs must have same length")
-    return sum(
-        _single_byte_hamming_distance(pair) for pair in zip(left, right))
+    # Xor the whole blobs as big integers and count the bits in one go
+    return _popcount(
+        int.from_bytes(as_byte_view(left), "little")
+        ^ int.from_bytes(as_byte_view(right), "little"))
+
+
+def hamming_matrix(blocks):
+    """All pairwise Hamming distances between equal length bytes objects
+
+    :return: A list of rows such that matrix[ii][jj] is the distance
+    between blocks[ii] and blocks[jj]
+    """
+    views = [as_byte_view(block) for block in blocks]
+    if len(set(len(view) for view in views)) > 1:
+        raise ValueError("Blocks must have same length")
+    ints = [int.from_bytes(view, "little") for view in views]
+    matrix = [[0] * len(ints) for _ in ints]
+    for ii, left in enumerate(ints):
+        for jj in range(ii + 1, len(ints)):
+            distance = _popcount(left ^ ints[jj])
+            matrix[ii][jj] = distance
+            matrix[jj][ii] = distance
+    return matrix
 
 
 def get_block(blob, blocksize, idx):
-    return blob[idx * blocksize: (idx + 1) * blocksize]
+    view = as_byte_view(blob).toreadonly()
+    return view[idx * blocksize: (idx + 1) * blocksize]
+
+
+class BlockView(Sequence):
+    """Lazy sequence of the keysize blocks of a buffer
+
+    Blocks are read-only memoryviews into the buffer, so nothing is copied.
+    They compare like the equivalent bytes objects. The last block is
+    shorter if the buffer length is not a multiple of the keysize.
+    """
+
+    def __init__(self, blob, keysize):
+        if keysize < 1:
+            raise ValueError("Keysize must be positive")
+        self._view = as_byte_view(blob).toreadonly()
+        self.keysize = keysize
+        # memoryviews are only hashable if the buffer they view is
+        self._hashable = isinstance(self._view.obj, bytes)
+
+    def __len__(self):
+        return -(-len(self._view) // self.keysize)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[ii] for ii in range(*idx.indices(len(self)))]
+        num_blocks = len(self)
+        if idx < 0:
+            idx += num_blocks
+        if idx < 0 or idx >= num_blocks:
+            raise IndexError("Block index out of range")
+        return self._view[idx * self.keysize: (idx + 1) * self.keysize]
+
+    def __iter__(self):
+        for start in range(0, len(self._view), self.keysize):
+            yield self._view[start:start + self.keysize]
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return list(self) == list(other)
+
+    __hash__ = None
+
+    def hashable_blocks(self):
+        """Generate hashable stand-ins that are equal iff the blocks are"""
+        if self._hashable:
+            yield from self
+            return
+        for block in self:
+            # The extra leading bit tells apart blocks of different length
+            yield int.from_bytes(block, "little") | (1 << (8 * len(block)))
+
+    def column(self, idx, out=None):
+        """Bytes at position idx of every block that is long enough"""
+        column = self._view[idx::self.keysize]
+        if out is None:
+            return bytes(column)
+        view = output_view(out, len(column))
+        view[:] = column
+        return view
+
+
+class PackedBlobs(Sequence):
+    """Sequence of blobs stored back to back in one buffer
+
+    bounds holds a (start, stop) pair per blob. Items are read-only
+    memoryviews into the buffer and compare like the equivalent bytes.
+    """
+
+    def __init__(self, buffer, bounds):
+        self.buffer = buffer
+        self.bounds = bounds
+        self._view = as_byte_view(buffer).toreadonly()
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[ii] for ii in range(*idx.indices(len(self)))]
+        start, stop = self.bounds[idx]
+        return self._view[start:stop]
+
+    def __iter__(self):
+        for start, stop in self.bounds:
+            yield self._view[start:stop]
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return list(self) == list(other)
+
+    __hash__ = None
 
 
 def brake_into_keysize_blocks(blob, keysize):
-    num_blocks = ceil(len(blob) / keysize)
-    # noinspection PyTypeChecker
-    return [get_block(blob, keysize, ii) for ii in range(num_blocks)]
+    return BlockView(blob, keysize)
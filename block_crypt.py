@@ -1,27 +1,77 @@
 __all__ = [
     "InvalidPaddingError",
+    "PARALLEL_MIN_LENGTH",
+    "cipher_cache_info",
+    "clear_cipher_cache",
+    "ecb_cipher",
     "find_potential_ecb",
     "pad_pkcs_7",
+    "pkcs_7_padding",
     "strip_pkcs_7",
+    "check_pkcs_7_many",
+    "strip_pkcs_7_many",
     "detect_potential_repeating_ecb_blocks",
     "ecb_encrypt",
     "cbc_encrypt_prepadded",
     "ecb_decrypt",
     "cbc_encrypt",
     "cbc_decrypt",
+    "EcbEncryptor",
+    "EcbDecryptor",
+    "CbcEncryptor",
+    "CbcDecryptor",
+    "ecb_encrypt_many",
+    "cbc_encrypt_many",
+    "cbc_decrypt_many",
 ]
 
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
 # noinspection PyPackageRequirements
 # false alert, is in requirements as pycryptodome
 from Crypto.Cipher import AES
 
-from bitfiddle import brake_into_keysize_blocks
-from primitive_crypt import xor_buffers
+from bitfiddle import PackedBlobs, as_byte_view, brake_into_keysize_blocks, \
+    output_view, write_output
+from primitive_crypt import xor_buffers, xor_in_place
+from util import check_thread_workers, parallel_ranges
+
+# Below this many bytes, parallel modes stay serial; thread handoff would
+# cost more than the AES work saved
+PARALLEL_MIN_LENGTH = 1 << 20
+
+
+@lru_cache(maxsize=256)
+def _cached_ecb_cipher(key):
+    return AES.new(key, AES.MODE_ECB)
+
+
+def ecb_cipher(key):
+    """
+    AES cipher object in ECB mode for key, shared via a bounded LRU cache
+
+    Saves the key schedule setup when the same key is used over and over,
+    as by the challenge oracles. ECB cipher objects have no state besides
+    the key, so sharing them is safe.
+    """
+    return _cached_ecb_cipher(bytes(key))
+
+
+def cipher_cache_info():
+    """Hits, misses and size of the ecb_cipher cache"""
+    return _cached_ecb_cipher.cache_info()
+
+
+def clear_cipher_cache():
+    """Drop all cached key schedules, e.g. after rotating keys"""
+    _cached_ecb_cipher.cache_clear()
 
 
 def detect_potential_repeating_ecb_blocks(ciphertext, blocksize=16):
     seen = set()
-    for block in brake_into_keysize_blocks(ciphertext, blocksize):
+    blocks = brake_into_keysize_blocks(ciphertext, blocksize)
+    for block in blocks.hashable_blocks():
         if block in seen:
             return True
         else:
@@ -36,44 +86,150 @@ def find_potential_ecb(cyphertexts):
     return None
 
 
-def pad_pkcs_7(blob, blocksize):
-    num_pad_bytes = blocksize - (len(blob) % blocksize)
-    padding = bytes([num_pad_bytes] * num_pad_bytes)
-    return blob + padding
+# Padding for each padding length, so it never has to be built per call
+_PADDINGS = tuple(bytes([length]) * length for length in range(256))
+
+
+def pkcs_7_padding(length, blocksize):
+    """The padding pad_pkcs_7 appends to length bytes"""
+    return _PADDINGS[blocksize - (length % blocksize)]
+
+
+def pad_pkcs_7(blob, blocksize, out=None):
+    """:param out: Buffer to write to, see bitfiddle.output_view"""
+    if not isinstance(blob, (bytes, bytearray)):
+        blob = as_byte_view(blob)
+    padding = pkcs_7_padding(len(blob), blocksize)
+    num_pad_bytes = len(padding)
+    if out is None:
+        if isinstance(blob, memoryview):
+            # Only bytes and bytearray support +
+            blob = blob.tobytes()
+        return blob + padding
+    view = output_view(out, len(blob) + num_pad_bytes)
+    view[:len(blob)] = blob
+    view[len(blob):] = padding
+    return view
 
 
 class InvalidPaddingError(ValueError):
     pass
 
 
+def _pkcs_7_padding_length(blob):
+    """Number of padding bytes in blob, 0 if the padding is invalid"""
+    length = len(blob)
+    if length == 0:
+        return 0
+    num_padding = blob[-1]
+    if num_padding == 0 or length < num_padding:
+        return 0
+    if blob[length - num_padding:] != _PADDINGS[num_padding]:
+        return 0
+    return num_padding
+
+
 def strip_pkcs_7(blob):
+    # Same checks as _pkcs_7_padding_length, inlined for the oracles
     length = len(blob)
     if length == 0:
         raise InvalidPaddingError()
     num_padding = blob[-1]
-    if num_padding == 0 or length < num_padding:
+    if (num_padding == 0 or length < num_padding
+            or blob[length - num_padding:] != _PADDINGS[num_padding]):
         raise InvalidPaddingError()
-    for byte in blob[-num_padding:]:
-        if byte != num_padding:
-            raise InvalidPaddingError()
     return blob[:-num_padding]
 
 
-def ecb_encrypt(key, plaintext):
-    cipher = AES.new(key, AES.MODE_ECB)
-    input_blob = pad_pkcs_7(plaintext, 16)
-    return cipher.encrypt(input_blob)
+def check_pkcs_7_many(blobs):
+    """List of whether each of blobs is validly padded"""
+    return [_pkcs_7_padding_length(blob) != 0 for blob in blobs]
+
+
+def strip_pkcs_7_many(blobs):
+    """
+    strip_pkcs_7 for each of blobs
+
+    :return: List of the stripped blobs, with None for every blob whose
+    padding is invalid instead of raising
+    """
+    stripped = []
+    for blob in blobs:
+        num_padding = _pkcs_7_padding_length(blob)
+        stripped.append(blob[:-num_padding] if num_padding else None)
+    return stripped
+
 
+def _transform_blocks(transform, blob, workers, out=None):
+    """
+    transform(chunk, output=...) over blob, in block aligned chunks that
+    worker threads write straight into one preallocated buffer
+    """
+    check_thread_workers(workers)
+    # pycryptodome takes bytes-like objects, but not e.g. mmap
+    view = as_byte_view(blob)
+    serial = workers is None or len(view) < PARALLEL_MIN_LENGTH
+    if serial and out is None:
+        return transform(view)
+    out_view = output_view(
+        bytearray(len(view)) if out is None else out, len(view))
+    if serial:
+        transform(view, output=out_view)
+    else:
+        def transform_range(start, stop):
+            transform(view[start:stop], output=out_view[start:stop])
 
-def ecb_decrypt(key, ciphertext):
-    cipher = AES.new(key, AES.MODE_ECB)
-    decrypted = cipher.decrypt(ciphertext)
+        parallel_ranges(transform_range, len(view), workers, alignment=16)
+    return bytes(out_view) if out is None else out_view
+
+
+def ecb_encrypt(key, plaintext, workers=None, out=None):
+    """
+    :param workers: Number of threads or a ThreadPoolExecutor to encrypt
+    inputs of at least PARALLEL_MIN_LENGTH bytes with. The threads write
+    into one shared buffer, so process pools are rejected, see
+    util.parallel_ranges.
+    :param out: Buffer to write to instead of returning new bytes, see
+    bitfiddle.output_view. The padded plaintext is encrypted in place
+    there, so no other copy is made.
+    """
+    cipher = ecb_cipher(key)
+    input_blob = pad_pkcs_7(plaintext, 16, out=out)
+    return _transform_blocks(
+        cipher.encrypt, input_blob, workers,
+        out=None if out is None else input_blob)
+
+
+def ecb_decrypt(key, ciphertext, workers=None, out=None):
+    """:param workers, out: See ecb_encrypt"""
+    cipher = ecb_cipher(key)
+    decrypted = _transform_blocks(cipher.decrypt, ciphertext, workers, out)
     return strip_pkcs_7(decrypted)
 
 
-def cbc_encrypt_prepadded(key, iv, plaintext):
+def cbc_encrypt_prepadded(key, iv, plaintext, reference=False, out=None):
+    """
+    CBC encrypt plaintext whose length is a multiple of the block size
+
+    :param reference: Chain the blocks by hand instead of using the
+    library's CBC mode. Much slower, but shows how CBC works.
+    :param out: Buffer to write to, see bitfiddle.output_view
+    """
+    if reference:
+        return write_output(
+            _cbc_encrypt_prepadded_reference(key, iv, plaintext), out)
+    cipher = AES.new(key, AES.MODE_CBC, iv=iv)
+    if out is None:
+        return cipher.encrypt(plaintext)
+    plaintext = as_byte_view(plaintext)
+    view = output_view(out, len(plaintext))
+    cipher.encrypt(plaintext, output=view)
+    return view
+
+
+def _cbc_encrypt_prepadded_reference(key, iv, plaintext):
     blocks = brake_into_keysize_blocks(plaintext, 16)
-    cipher = AES.new(key, AES.MODE_ECB)
+    cipher = ecb_cipher(key)
 
     def cryptoblocks():
         last_block = iv
@@ -85,14 +241,76 @@ def cbc_encrypt_prepadded(key, iv, plaintext):
     return b''.join([cb for cb in cryptoblocks()])
 
 
-def cbc_encrypt(key, iv, plaintext):
-    return cbc_encrypt_prepadded(key, iv, pad_pkcs_7(plaintext, 16))
+def cbc_encrypt(key, iv, plaintext, reference=False, out=None):
+    """:param out: See ecb_encrypt"""
+    return cbc_encrypt_prepadded(
+        key, iv, pad_pkcs_7(plaintext, 16, out=out), reference=reference,
+        out=out)
+
+
+# From about this length on, setting up a fresh CBC cipher costs less than
+# doing the chaining xor ourselves
+_CBC_KEY_SETUP_AMORTIZED_LENGTH = 1024
+
 
+def cbc_decrypt(key, iv, ciphertext, reference=False, workers=None,
+                out=None):
+    """
+    CBC decrypt and strip padding, see cbc_encrypt_prepadded
 
-def cbc_decrypt(key, iv, ciphertext):
+    :param workers: Number of threads or a ThreadPoolExecutor to decrypt
+    ciphertexts of at least PARALLEL_MIN_LENGTH bytes with, see
+    ecb_encrypt
+    :param out: Buffer to write to, see bitfiddle.output_view
+    """
     assert len(ciphertext) % 16 == 0
+    check_thread_workers(workers)
+    ciphertext = as_byte_view(ciphertext)
+    if reference:
+        return write_output(
+            strip_pkcs_7(_cbc_decrypt_reference(key, iv, ciphertext)), out)
+    if workers is not None and len(ciphertext) >= PARALLEL_MIN_LENGTH:
+        return _cbc_decrypt_parallel(key, iv, ciphertext, workers, out)
+    if len(ciphertext) >= _CBC_KEY_SETUP_AMORTIZED_LENGTH:
+        cipher = AES.new(key, AES.MODE_CBC, iv=iv)
+        if out is None:
+            return strip_pkcs_7(cipher.decrypt(ciphertext))
+        view = output_view(out, len(ciphertext))
+        cipher.decrypt(ciphertext, output=view)
+        return strip_pkcs_7(view)
+    if len(iv) != 16:
+        raise ValueError("IV must be one block long")
+    # Plaintext block i is D(C_i) xor C_(i-1), so decrypt all blocks at once
+    # with the cached key schedule and xor in the shifted ciphertext
+    view = output_view(
+        bytearray(len(ciphertext)) if out is None else out, len(ciphertext))
+    ecb_cipher(key).decrypt(ciphertext, output=view)
+    xor_in_place(view[:16], iv)
+    xor_in_place(view[16:], ciphertext[:-16])
+    stripped = strip_pkcs_7(view)
+    return bytes(stripped) if out is None else stripped
+
+
+def _cbc_decrypt_parallel(key, iv, ciphertext, workers, out):
+    view = as_byte_view(ciphertext)
+    out_view = output_view(
+        bytearray(len(view)) if out is None else out, len(view))
+
+    def decrypt_range(start, stop):
+        # Unlike encryption, decrypting only needs the preceding cipher
+        # block, so every range starts its own chain from there
+        chain_iv = iv if start == 0 else view[start - 16:start]
+        AES.new(key, AES.MODE_CBC, iv=chain_iv).decrypt(
+            view[start:stop], output=out_view[start:stop])
+
+    parallel_ranges(decrypt_range, len(view), workers, alignment=16)
+    stripped = strip_pkcs_7(out_view)
+    return bytes(stripped) if out is None else stripped
+
+
+def _cbc_decrypt_reference(key, iv, ciphertext):
     blocks = brake_into_keysize_blocks(ciphertext, 16)
-    cipher = AES.new(key, AES.MODE_ECB)
+    cipher = ecb_cipher(key)
 
     def plainblocks():
         last_block = iv
@@ -102,4 +320,184 @@ def cbc_decrypt(key, iv, ciphertext):
             last_block = block
             yield plain_block
 
-    return strip_pkcs_7(b''.join(pb for pb in plainblocks()))
+    return b''.join(pb for pb in plainblocks())
+
+
+class _BlockStream(ABC):
+    """
+    Incremental block cipher
+
+    update() takes chunks of any size and returns what can already be
+    processed; finalize() returns the rest. Only a partial block (plus,
+    when decrypting, the possibly padded last block) is kept in memory.
+    """
+
+    _hold_back_last_block = False
+
+    def __init__(self, cipher):
+        self._cipher = cipher
+        self._pending = bytearray()
+
+    def update(self, chunk):
+        self._pending += chunk
+        length = len(self._pending)
+        if self._hold_back_last_block:
+            usable = max(length - 1, 0) // 16 * 16
+        else:
+            usable = length - length % 16
+        if usable == 0:
+            return b''
+        processed = self._process(memoryview(self._pending)[:usable])
+        del self._pending[:usable]
+        return processed
+
+    @abstractmethod
+    def finalize(self):
+        """The rest of the output, after the last update()"""
+
+    @abstractmethod
+    def _process(self, blocks):
+        """Encrypt or decrypt whole blocks"""
+
+
+class _BlockEncryptor(_BlockStream):
+
+    def _process(self, blocks):
+        return self._cipher.encrypt(blocks)
+
+    def finalize(self):
+        last_blocks = pad_pkcs_7(bytes(self._pending), 16)
+        self._pending.clear()
+        return self._cipher.encrypt(last_blocks)
+
+
+class _BlockDecryptor(_BlockStream):
+    _hold_back_last_block = True
+
+    def _process(self, blocks):
+        return self._cipher.decrypt(blocks)
+
+    def finalize(self):
+        if len(self._pending) % 16 != 0:
+            raise ValueError("Ciphertext is not a whole number of blocks")
+        last_block = self._cipher.decrypt(bytes(self._pending))
+        self._pending.clear()
+        return strip_pkcs_7(last_block)
+
+
+class EcbEncryptor(_BlockEncryptor):
+    """Incremental ecb_encrypt"""
+
+    def __init__(self, key):
+        _BlockEncryptor.__init__(self, ecb_cipher(key))
+
+
+class EcbDecryptor(_BlockDecryptor):
+    """Incremental ecb_decrypt"""
+
+    def __init__(self, key):
+        _BlockDecryptor.__init__(self, ecb_cipher(key))
+
+
+class CbcEncryptor(_BlockEncryptor):
+    """Incremental cbc_encrypt, the cipher object carries the chaining"""
+
+    def __init__(self, key, iv):
+        _BlockEncryptor.__init__(self, AES.new(key, AES.MODE_CBC, iv=iv))
+
+
+class CbcDecryptor(_BlockDecryptor):
+    """Incremental cbc_decrypt"""
+
+    def __init__(self, key, iv):
+        _BlockDecryptor.__init__(self, AES.new(key, AES.MODE_CBC, iv=iv))
+
+
+def _pack_pkcs_7(plaintexts):
+    """PKCS#7 padded plaintexts joined into one blob, and their bounds"""
+    parts = []
+    bounds = []
+    position = 0
+    for plaintext in plaintexts:
+        padding = _PADDINGS[16 - len(plaintext) % 16]
+        parts.append(plaintext)
+        parts.append(padding)
+        stop = position + len(plaintext) + len(padding)
+        bounds.append((position, stop))
+        position = stop
+    return b''.join(parts), bounds
+
+
+def ecb_encrypt_many(key, plaintexts):
+    """
+    ecb_encrypt for each of plaintexts, in a single AES call
+
+    :return: PackedBlobs of the ciphertexts
+    """
+    padded, bounds = _pack_pkcs_7(plaintexts)
+    return PackedBlobs(ecb_cipher(key).encrypt(padded), bounds)
+
+
+def cbc_encrypt_many(key, ivs, plaintexts):
+    """
+    cbc_encrypt for each iv and plaintext, with a single cipher object
+
+    :return: PackedBlobs of the ciphertexts
+    """
+    ivs = list(ivs)
+    padded, bounds = _pack_pkcs_7(plaintexts)
+    if len(ivs) != len(bounds):
+        raise ValueError("Need one iv per plaintext")
+    if any(len(iv) != 16 for iv in ivs):
+        raise ValueError("IV must be one block long")
+    if not ivs:
+        return PackedBlobs(b'', bounds)
+    cipher = AES.new(key, AES.MODE_CBC, iv=ivs[0])
+    chain = ivs[0]
+    encrypted = []
+    for iv, (start, stop) in zip(ivs, bounds):
+        # The cipher chains on from the previous message's last block;
+        # xoring that out of the first block and the iv in restarts the
+        # chain at iv without setting up a new key schedule
+        first_block = (int.from_bytes(padded[start:start + 16], "little")
+                       ^ int.from_bytes(chain, "little")
+                       ^ int.from_bytes(iv, "little"))
+        encrypted.append(cipher.encrypt(
+            first_block.to_bytes(16, "little") + padded[start + 16:stop]))
+        chain = encrypted[-1][-16:]
+    return PackedBlobs(b''.join(encrypted), bounds)
+
+
+def cbc_decrypt_many(key, ivs, ciphertexts):
+    """
+    cbc_decrypt for each iv and ciphertext, in a single AES call
+
+    :return: PackedBlobs of the plaintexts
+    :raises InvalidPaddingError: If any of the paddings is invalid
+    """
+    ivs = list(ivs)
+    ciphertexts = list(ciphertexts)
+    if len(ivs) != len(ciphertexts):
+        raise ValueError("Need one iv per ciphertext")
+    if any(len(iv) != 16 for iv in ivs):
+        raise ValueError("IV must be one block long")
+    if any(len(ciphertext) % 16 != 0 for ciphertext in ciphertexts):
+        raise ValueError("Ciphertext is not a whole number of blocks")
+    packed = b''.join(ciphertexts)
+    decrypted = bytearray(len(packed))
+    ecb_cipher(key).decrypt(packed, output=decrypted)
+    # Each plaintext block is the decrypted block xor the cipher block
+    # before it, or the iv for a message's first block
+    previous = b''.join(
+        part for iv, ciphertext in zip(ivs, ciphertexts) if ciphertext
+        for part in (iv, ciphertext[:-16]))
+    xor_in_place(decrypted, previous)
+    view = memoryview(decrypted)
+    bounds = []
+    position = 0
+    for ciphertext in ciphertexts:
+        stop = position + len(ciphertext)
+        stripped = strip_pkcs_7(view[position:stop])
+        bounds.append((position, position + len(stripped)))
+        position = stop
+    return PackedBlobs(decrypted, bounds)
@@ -1,10 +1,14 @@
 import base64
 import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import kvserialize
 from bitfiddle import \
+    as_byte_view, \
     brake_into_keysize_blocks, \
-    get_block
+    get_block, \
+    join_into
 from block_crypt import \
     InvalidPaddingError, \
     cbc_encrypt, \
@@ -13,24 +17,50 @@ from block_crypt import \
     ecb_encrypt, \
     detect_potential_repeating_ecb_blocks, \
     cbc_decrypt, \
+    ecb_cipher, \
+    pkcs_7_padding, \
     strip_pkcs_7
 from primitive_crypt import xor_buffers
+from util import all_matches
 from util import bytes_from_file
+from util import check_thread_workers
 from util import equal_prefix_length
+from util import first_match
 from util import lines_from_file
+from util import parallel_map
 from util import random_blob
 
 
+class _PlaintextBuffer(threading.local):
+    """Per thread bytearray that oracles assemble their plaintexts in"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def join_padded(self, parts):
+        """
+        View of the joined parts with PKCS#7 padding, valid until the next
+        join. Ready to encrypt, the padding isn't copied in a second pass.
+        """
+        length = sum(len(as_byte_view(part)) for part in parts)
+        return join_into(self.buffer,
+                         list(parts) + [pkcs_7_padding(length, 16)])
+
+
+_challenge_11_plaintext = _PlaintextBuffer()
+
+
 def challenge_11_oracle(input_blob):
     key = secrets.token_bytes(16)
     mode = secrets.choice(['ECB', 'CBC'])
     prefix = random_blob(5, 10)
     postfix = random_blob(5, 10)
-    plaintext = prefix + input_blob + postfix
-    if mode == 'ECB':
-        return ecb_encrypt(key, plaintext), mode
-    iv = secrets.token_bytes(16)
-    return cbc_encrypt(key, iv, plaintext), mode
+    with _challenge_11_plaintext.join_padded(
+            [prefix, input_blob, postfix]) as plaintext:
+        if mode == 'ECB':
+            return ecb_cipher(key).encrypt(plaintext), mode
+        iv = secrets.token_bytes(16)
+        return cbc_encrypt_prepadded(key, iv, plaintext), mode
 
 
 def challenge_11_test():
@@ -48,9 +78,12 @@ class Challenge14Oracle:
         self._key = secrets.token_bytes(16)
         self._prefix = prefix
         self._suffix = suffix
+        self._plaintext = _PlaintextBuffer()
 
     def __call__(self, input_blob):
-        return ecb_encrypt(self._key, self._prefix + input_blob + self._suffix)
+        with self._plaintext.join_padded(
+                [self._prefix, input_blob, self._suffix]) as plaintext:
+            return ecb_cipher(self._key).encrypt(plaintext)
 
 
 class Challenge12Oracle(Challenge14Oracle):
@@ -63,25 +96,51 @@ class Challenge14Solver:
 
     def __init__(self, oracle):
         self.oracle = oracle
+        self.num_queries = 0
+        self._num_queries_lock = threading.Lock()
+        # Setup answers, so that no measurement repeats an earlier probe
+        self._probes = {}
         min_noticable_arg_length = self._min_noticable_arg_length()
         self.blocksize = self._find_blocksize(min_noticable_arg_length)
         num_prefix_only_blocks = self._num_prefix_only_blocks()
         self.prefix_length = self._find_prefix_length(num_prefix_only_blocks)
         self.suffix_length = self._find_suffix_length(min_noticable_arg_length)
+        self.setup_queries = self.num_queries
+
+    def _query(self, input_blob):
+        with self._num_queries_lock:
+            self.num_queries += 1
+        return self.oracle(input_blob)
+
+    def _probe(self, input_blob):
+        """Cached oracle answer, for the setup probes"""
+        if input_blob not in self._probes:
+            self._probes[input_blob] = self._query(input_blob)
+        return self._probes[input_blob]
 
     def _min_noticable_arg_length(self):
         """Find minimum arg size to change ciphertext length."""
-        length_for_0 = len(self.oracle(b''))
-        ii = 0
-        while True:
-            ii += 1
-            length_for_ii = len(self.oracle(b'A' * ii))
-            if length_for_ii != length_for_0:
-                return ii
+        # The ciphertext length only grows with the arg length, so double the
+        # arg until it grows, then bisect between the last two lengths
+        length_for_0 = len(self._probe(b''))
+
+        def changes_length(arg_length):
+            return len(self._probe(b'A' * arg_length)) != length_for_0
+
+        unchanged, changed = 0, 1
+        while not changes_length(changed):
+            unchanged, changed = changed, 2 * changed
+        while changed - unchanged > 1:
+            middle = (unchanged + changed) // 2
+            if changes_length(middle):
+                changed = middle
+            else:
+                unchanged = middle
+        return changed
 
     def _find_blocksize(self, min_noticable_arg_length):
-        length1 = len(self.oracle(b''))
-        length2 = len(self.oracle(b'A' * min_noticable_arg_length))
+        length1 = len(self._probe(b''))
+        length2 = len(self._probe(b'A' * min_noticable_arg_length))
         return length2 - length1
 
     def _num_prefix_only_blocks(self):
@@ -89,7 +148,7 @@ class Challenge14Solver:
         # We find this by inserting different arguments and seeing how many
         # blocks are identical in both cyphertexts
         return \
-            (equal_prefix_length(self.oracle(b'A'), self.oracle(b'B'))
+            (equal_prefix_length(self._probe(b'A'), self._probe(b'B'))
              // self.blocksize)
 
     def _find_prefix_length(self, num_prefix_only_blocks):
@@ -97,13 +156,21 @@ class Challenge14Solver:
         # Basic idea: Find out how much padding is needed to completely fill
         # the rest of the block containing the end of the prefix.
         assert self._is_ecb()
-        for ii in range(self.blocksize):
-            length = self._try_prefix_padding_length(num_prefix_only_blocks, ii)
-            if length is not None:
-                return length
-
-    def _try_prefix_padding_length(self, num_prefix_only_blocks, padlength):
-        """Prefix length if this is the padding length for _find_prefix_length()"""
+        if self._padding_fills_block(num_prefix_only_blocks, 0):
+            return num_prefix_only_blocks * self.blocksize
+        # Otherwise any padding at least as long as the needed one fills the
+        # block, so bisect for the shortest. blocksize - 1 bytes always do.
+        too_short, enough = 0, self.blocksize - 1
+        while enough - too_short > 1:
+            middle = (too_short + enough) // 2
+            if self._padding_fills_block(num_prefix_only_blocks, middle):
+                enough = middle
+            else:
+                too_short = middle
+        return (num_prefix_only_blocks + 1) * self.blocksize - enough
+
+    def _padding_fills_block(self, num_prefix_only_blocks, padlength):
+        """Whether padlength bytes fill up the block with the prefix's end"""
         # Basic idea: If we insert a blob of equal bytes long enough to fill
         # both the padding and the next two blocks of plaintext, then the next
         # two blocks of cyphertext become equal.
@@ -114,16 +181,15 @@ class Challenge14Solver:
             block_idx = num_prefix_only_blocks + 1
         # We actually need to test two different filler bytes, because
         # otherwise we might be fooled by the suffix starting with the filler
-        # bytes we try
+        # bytes we try. Both must make the same blocks equal, or a prefix
+        # ending in one filler and a suffix starting with the other could.
         for test_blob in [b'A' * test_blob_length, b'B' * test_blob_length]:
-            encrypted = self.oracle(test_blob)
-            first_block = \
-                get_block(encrypted, self.blocksize, block_idx)
-            second_block = \
-                get_block(encrypted, self.blocksize, block_idx + 1)
-            if first_block != second_block:
-                return None
-        return block_idx * self.blocksize - padlength
+            blocks = brake_into_keysize_blocks(
+                self._probe(test_blob), self.blocksize)
+            if block_idx + 1 >= len(blocks) or \
+                    blocks[block_idx] != blocks[block_idx + 1]:
+                return False
+        return True
 
     def _find_suffix_length(self, min_noticeable_arg_length):
         """Find length of the oracle's appended suffix."""
@@ -133,7 +199,7 @@ class Challenge14Solver:
         # Subtract the previously calculated prefix length from that, and the
         # rest is suffix.
         return \
-            (len(self.oracle(b'A' * min_noticeable_arg_length))
+            (len(self._probe(b'A' * min_noticeable_arg_length))
              - self.blocksize
              - min_noticeable_arg_length
              - self.prefix_length)
@@ -145,16 +211,61 @@ class Challenge14Solver:
         return detect_potential_repeating_ecb_blocks(
             input_blob, blocksize=self.blocksize)
 
-    def solve(self):
+    def solve(self, batched=True, workers=None, max_in_flight=None):
+        """
+        Recover the suffix byte by byte
+
+        :param batched: Guess each byte with one oracle call, see
+        guess_next_byte_batched, falling back to guess_next_byte where that
+        fails. Otherwise only use guess_next_byte.
+        :param workers, max_in_flight: See guess_next_byte
+        """
+        check_thread_workers(workers)
         known_bytes = b''
         while len(known_bytes) < self.suffix_length:
-            known_bytes += bytes([self.guess_next_byte(known_bytes)])
+            byte = None
+            if batched:
+                byte = self.guess_next_byte_batched(known_bytes)
+            if byte is None:
+                byte = self.guess_next_byte(
+                    known_bytes, workers, max_in_flight)
+            known_bytes += bytes([byte])
         return known_bytes
 
-    def guess_next_byte(self, known_bytes):
-        for ii in range(256):
-            if self.try_next_byte(known_bytes, ii):
-                return ii
+    def guess_next_byte_batched(self, known_bytes):
+        """Next suffix byte from a single oracle call, None if not found"""
+        # Same idea as try_next_byte, but all 256 guesses are injected at
+        # once as a dictionary of blocks. After it comes the padding that
+        # puts the unknown byte at the end of a block, which then must
+        # equal the dictionary block of the right guess.
+        blocksize = self.blocksize
+        align_length = -self.prefix_length % blocksize
+        dictionary_start = (self.prefix_length + align_length) // blocksize
+        padlength = (blocksize - 1 - len(known_bytes)) % blocksize
+        prior_bytes = b'A' * (blocksize - 1) + known_bytes
+        block_start = prior_bytes[len(prior_bytes) - blocksize + 1:]
+        dictionary = b''.join(
+            block_start + bytes([byte]) for byte in range(256))
+        encrypted = brake_into_keysize_blocks(
+            self._query(b'A' * align_length + dictionary + b'A' * padlength),
+            blocksize)
+        target_idx = (dictionary_start + 256
+                      + (padlength + len(known_bytes)) // blocksize)
+        if target_idx >= len(encrypted):
+            return None
+        guesses = {bytes(block): byte for byte, block in enumerate(
+            encrypted[dictionary_start:dictionary_start + 256])}
+        return guesses.get(bytes(encrypted[target_idx]))
+
+    def guess_next_byte(self, known_bytes, workers=None, max_in_flight=None):
+        """
+        :param workers, max_in_flight: Threads to try candidate bytes
+        concurrently with, for high latency oracles, see util.first_match.
+        The guess is the same as when trying one byte after the other.
+        """
+        return first_match(
+            lambda byte: self.try_next_byte(known_bytes, byte),
+            range(256), workers, max_in_flight)
 
     def try_next_byte(self, known_bytes, byte):
         # Basic idea same as in challenge 12:
@@ -168,11 +279,11 @@ class Challenge14Solver:
         padlength = self.blocksize - used_in_block - 1
         testarg = b'A' * padlength
         encrypted_block = get_block(
-            self.oracle(testarg),
+            self._query(testarg),
             self.blocksize,
             num_prior_blocks)
         comparison_block = get_block(
-            self.oracle(testarg + known_bytes + bytes([byte])),
+            self._query(testarg + known_bytes + bytes([byte])),
             self.blocksize,
             num_prior_blocks)
         return encrypted_block == comparison_block
@@ -276,7 +387,12 @@ def cbc_padding_crack_check_iv_suffix(oracle, suffix, block):
     return oracle.check_padding(test_iv, block)
 
 
-def cbc_padding_crack_extend_iv_suffix(oracle, old_suffix, block):
+def cbc_padding_crack_extend_iv_suffix(oracle, old_suffix, block,
+                                       workers=None, max_in_flight=None):
+    """
+    :param workers, max_in_flight: Threads to check candidates concurrently
+    with, for high latency oracles, see util.all_matches
+    """
     old_length = len(old_suffix)
     new_length = old_length + 1
     if old_length == 0:
@@ -284,33 +400,75 @@ def cbc_padding_crack_extend_iv_suffix(oracle, old_suffix, block):
     else:
         trafo_byte = new_length ^ old_length
         new_susuffix = xor_buffers(old_suffix, bytes(old_length * [trafo_byte]))
-    for i in range(256):
-        candidate = bytes([i]) + new_susuffix
-        if cbc_padding_crack_check_iv_suffix(oracle, candidate, block):
-            yield candidate
-
-
-def cbc_padding_crack_single_block(oracle, block, previous_block):
+    candidates = [bytes([i]) + new_susuffix for i in range(256)]
+    yield from all_matches(
+        lambda candidate: cbc_padding_crack_check_iv_suffix(
+            oracle, candidate, block),
+        candidates, workers, max_in_flight)
+
+
+def cbc_padding_crack_single_block(oracle, block, previous_block,
+                                   workers=None, max_in_flight=None,
+                                   progress=None):
+    """
+    :param workers, max_in_flight: See cbc_padding_crack_extend_iv_suffix
+    :param progress: Called with the number of bytes recovered so far after
+    each byte
+    """
     possible_iv_suffixes = [b""]
     for i in range(16):
         possible_iv_suffixes = [new_suffix
                                 for old_suffix in possible_iv_suffixes
                                 for new_suffix in
                                 cbc_padding_crack_extend_iv_suffix(
-                                    oracle, old_suffix, block)]
+                                    oracle, old_suffix, block,
+                                    workers, max_in_flight)]
+        if progress is not None:
+            progress(i + 1)
     forged_iv = possible_iv_suffixes[0]
     oracle.check_padding(forged_iv, block)
     mask = xor_buffers(bytes(16 * [16]), previous_block)
     return xor_buffers(forged_iv, mask)
 
 
-def cbc_padding_crack(oracle, iv, encrypted):
+def cbc_padding_crack(oracle, iv, encrypted, workers=None, progress=None,
+                      guess_workers=None, max_in_flight=None):
+    """
+    :param workers: None or 1 to crack one block after the other, or a
+    number of threads or a ThreadPoolExecutor to crack blocks concurrently.
+    Each block only depends on itself and the block before it. Threads
+    share the oracle, so process pools are rejected, see
+    util.check_thread_workers.
+    :param progress: Called as progress(block_index, num_bytes) whenever a
+    byte of a block is recovered. With workers, it is called from the
+    worker threads.
+    :param guess_workers, max_in_flight: Threads to check the candidate
+    bytes of each guess concurrently with, see
+    cbc_padding_crack_extend_iv_suffix
+    """
     assert len(encrypted) % 16 == 0
-    encrypted_blocks = [iv] + brake_into_keysize_blocks(encrypted, 16)
-
-    def plainblocks():
-        for i in range(1, len(encrypted_blocks)):
-            yield cbc_padding_crack_single_block(
-                oracle, encrypted_blocks[i], encrypted_blocks[i - 1])
-
-    return strip_pkcs_7(b''.join([block for block in plainblocks()]))
+    check_thread_workers(workers)
+    check_thread_workers(guess_workers)
+    encrypted_blocks = brake_into_keysize_blocks(encrypted, 16)
+    previous_blocks = [iv] + encrypted_blocks[:-1]
+
+    def crack_block(block_index):
+        block_progress = None
+        if progress is not None:
+            def block_progress(num_bytes):
+                progress(block_index, num_bytes)
+        return cbc_padding_crack_single_block(
+            oracle, encrypted_blocks[block_index],
+            previous_blocks[block_index], guess_workers, max_in_flight,
+            block_progress)
+
+    block_indices = range(len(encrypted_blocks))
+    if isinstance(workers, int) and workers > 1:
+        # Threads rather than parallel_map's processes, the oracle is
+        # shared and cracking mostly waits for it. A ThreadPoolExecutor
+        # passed in goes to parallel_map as is.
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            plainblocks = parallel_map(crack_block, block_indices, executor)
+    else:
+        plainblocks = parallel_map(crack_block, block_indices, workers)
+    return strip_pkcs_7(b''.join(plainblocks))
@@ -0,0 +1,207 @@
+"""Scan large ciphertext corpora for ECB candidates
+
+Unlike block_crypt.find_potential_ecb, the corpus is read from a file
+through mmap rather than from a list in memory, and every record with a
+repeated block is reported, not just the first one. Records are hex or
+base64 lines, or raw fixed-size records.
+
+    python ecb_scan.py corpus.txt [--encoding hex|base64|raw]
+        [--record-size N] [--blocksize 16] [--workers N]
+
+prints one line per candidate: record number, file offset and the number
+of repeated blocks. Blank lines are not records. Lines that don't decode
+are skipped and counted on stderr.
+"""
+__all__ = ["EcbCandidate", "repeated_blocks", "scan_ecb_corpus"]
+
+import argparse
+import binascii
+import mmap
+import os
+import sys
+from collections import defaultdict, namedtuple
+from concurrent.futures import Executor
+from functools import partial
+
+from bitfiddle import brake_into_keysize_blocks
+from util import parallel_map
+
+EcbCandidate = namedtuple(
+    "EcbCandidate", ["record", "file_offset", "repeats", "block_offsets"])
+EcbCandidate.__doc__ = """
+A record with repeated blocks
+
+record is the number of the record (line) in the corpus, file_offset where
+it starts in the file, repeats how many blocks repeat an earlier block and
+block_offsets the offsets of the repeated blocks in the decoded record,
+one tuple per distinct repeated block.
+"""
+
+_DECODERS = {
+    "hex": binascii.a2b_hex,
+    "base64": binascii.a2b_base64,
+    "raw": None,
+}
+
+
+def repeated_blocks(ciphertext, blocksize=16):
+    """
+    Offsets of the blocks that occur more than once in ciphertext
+
+    :return: One tuple of offsets per repeated block, in order of first
+    occurrence
+    """
+    offsets = defaultdict(list)
+    blocks = brake_into_keysize_blocks(ciphertext, blocksize)
+    for index, block in enumerate(blocks.hashable_blocks()):
+        offsets[block].append(index * blocksize)
+    return tuple(tuple(block_offsets) for block_offsets in offsets.values()
+                 if len(block_offsets) > 1)
+
+
+def _line_records(mapped, start, stop, decoder, bad_lines):
+    """Skips blank lines, the offsets of undecodable ones go to bad_lines"""
+    position = start
+    while position < stop:
+        end = mapped.find(b"\n", position, stop)
+        if end == -1:
+            end = stop
+        line = mapped[position:end].strip()
+        if line:
+            try:
+                yield position, decoder(line)
+            except binascii.Error:
+                bad_lines.append(position)
+        position = end + 1
+
+
+def _raw_records(mapped, start, stop, record_size):
+    # Blocks of memoryview slices are hashed as integers, nothing is copied
+    with memoryview(mapped) as view:
+        for position in range(start, stop, record_size):
+            yield position, view[position:min(position + record_size, stop)]
+
+
+def _scan_records(records, blocksize):
+    candidates = []
+    num_records = 0
+    for num_records, (file_offset, ciphertext) in enumerate(records, 1):
+        block_offsets = repeated_blocks(ciphertext, blocksize)
+        if block_offsets:
+            repeats = sum(len(offsets) - 1 for offsets in block_offsets)
+            candidates.append(EcbCandidate(
+                num_records - 1, file_offset, repeats, block_offsets))
+    return num_records, candidates
+
+
+def _scan_range(file_name, encoding, record_size, blocksize, byte_range):
+    """
+    Record count, candidates numbered from 0 and offsets of undecodable
+    lines of a range of the file
+    """
+    start, stop = byte_range
+    bad_lines = []
+    with open(file_name, "br") as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if encoding == "raw":
+            records = _raw_records(mapped, start, stop, record_size)
+        else:
+            records = _line_records(
+                mapped, start, stop, _DECODERS[encoding], bad_lines)
+        num_records, candidates = _scan_records(records, blocksize)
+        # Release the last record views before the map gets closed
+        records.close()
+        return num_records, candidates, bad_lines
+
+
+def _split_ranges(file_name, size, encoding, record_size, pieces):
+    """Byte ranges of about size / pieces, cut at record boundaries"""
+    if encoding == "raw":
+        piece_size = -(-size // pieces)
+        piece_size += -piece_size % record_size
+        return [(start, min(start + piece_size, size))
+                for start in range(0, size, piece_size)]
+    boundaries = [0]
+    with open(file_name, "br") as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for piece in range(1, pieces):
+            target = max(piece * size // pieces, boundaries[-1])
+            end_of_line = mapped.find(b"\n", target)
+            if end_of_line == -1 or end_of_line + 1 >= size:
+                break
+            if end_of_line + 1 > boundaries[-1]:
+                boundaries.append(end_of_line + 1)
+    boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def scan_ecb_corpus(file_name, encoding="hex", record_size=None,
+                    blocksize=16, workers=None, on_bad_line=None):
+    """
+    Every record in a corpus file that has a repeated block
+
+    :param encoding: "hex" or "base64" for one ciphertext per line, "raw"
+    for consecutive records of record_size bytes. Blank lines are not
+    records, lines that don't decode are skipped and not numbered either.
+    :param workers: None for scanning in this process, a number of worker
+    processes or an Executor, see util.parallel_map. Each worker maps the
+    file itself, only the results are sent back.
+    :param on_bad_line: Called with the file offset of every skipped
+    undecodable line, in file order
+    :return: List of EcbCandidate, in file order
+    """
+    if encoding not in _DECODERS:
+        raise ValueError("Unknown encoding {}".format(encoding))
+    if encoding == "raw" and (record_size is None or record_size < 1):
+        raise ValueError("Raw records need a positive record_size")
+    size = os.path.getsize(file_name)
+    if size == 0:
+        return []
+    if workers is None:
+        pieces = 1
+    elif isinstance(workers, Executor):
+        pieces = 16
+    else:
+        pieces = 4 * max(workers, 1)
+    ranges = _split_ranges(file_name, size, encoding, record_size, pieces)
+    scan = partial(_scan_range, file_name, encoding, record_size, blocksize)
+    candidates = []
+    first_record = 0
+    for num_records, range_candidates, bad_lines in parallel_map(
+            scan, ranges, workers):
+        candidates.extend(
+            candidate._replace(record=candidate.record + first_record)
+            for candidate in range_candidates)
+        first_record += num_records
+        if on_bad_line is not None:
+            for file_offset in bad_lines:
+                on_bad_line(file_offset)
+    return candidates
+
+
+def _main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Report records with repeated blocks in a corpus file")
+    parser.add_argument("corpus", help="corpus file, mapped into memory")
+    parser.add_argument("--encoding", choices=sorted(_DECODERS),
+                        default="hex", help="record encoding")
+    parser.add_argument("--record-size", type=int, default=None,
+                        help="bytes per record for raw corpora")
+    parser.add_argument("--blocksize", type=int, default=16,
+                        help="cipher block size in bytes")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes")
+    args = parser.parse_args(args)
+    bad_lines = []
+    candidates = scan_ecb_corpus(args.corpus, args.encoding,
+                                 args.record_size, args.blocksize,
+                                 args.workers, bad_lines.append)
+    for candidate in candidates:
+        print(candidate.record, candidate.file_offset, candidate.repeats)
+    if bad_lines:
+        print("Skipped {} undecodable lines, the first at offset {}".format(
+            len(bad_lines), bad_lines[0]), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    _main()
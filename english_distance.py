@@ -1,47 +1,302 @@
-"""Compare strings (to English) by byte frequency"""
-__all__ = ["english_distance"]
+"""Compare strings (to English) by byte and n-gram frequency
 
-from math import sqrt, pow
+All scorers map a text to a number, lower meaning more like English. They
+are registered by name in SCORERS, see get_scorer.
+"""
+__all__ = ["SCORERS", "english_distance", "get_scorer", "register_scorer"]
 
+import os
+from abc import ABC, abstractmethod
+from collections import Counter
+from itertools import repeat
+from math import dist, log, sqrt
+from operator import itemgetter, mul
+
+from bitfiddle import BlockView
+from frequency_model import load_model
 from util import bytes_from_file
 
+_NUM_BYTE_STATES = 256
+_INPUTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "inputs")
+_ENGLISH_SAMPLE_FILE = os.path.join(_INPUTS_DIR, "english_sample.txt")
+_ENGLISH_MODEL_FILE = os.path.join(_INPUTS_DIR, "english_model.bin")
+
 
 def _count_byte_occurrences(blob):
-    counts = [0] * 256
-    byteiter = (int.from_bytes(blob[ii:ii + 1], "big") for ii in
-                range(len(blob)))
-    for byte in byteiter:
-        counts[byte] += 1
+    if len(blob) == 0:
+        return [0] * _NUM_BYTE_STATES
+    counts = [0] * _NUM_BYTE_STATES
+    # Counter does the counting loop in C
+    for byte, count in Counter(memoryview(blob).cast("B")).items():
+        counts[byte] = count
     return counts
 
 
 def _get_byte_frequencies(blob):
-    counts = _count_byte_occurrences(blob)
+    return _frequencies_from_counts(_count_byte_occurrences(blob))
+
+
+def _frequencies_from_counts(counts):
     sum_ = sum(counts)
     if sum_ == 0:
-        return [0] * 256
-    return [value / sum_ for value in counts]
+        return [0] * _NUM_BYTE_STATES
+    return list(map(sum_.__rtruediv__, counts))
 
 
 def _byte_frequency_distance(left, right):
-    num_byte_states = 256
-    sum_ = 0
-    for ii in range(num_byte_states):
-        sum_ += pow(left[ii] - right[ii], 2)
-    return sqrt(sum_ / num_byte_states)
+    return dist(left, right) / sqrt(_NUM_BYTE_STATES)
+
+
+# _XOR_PERMUTATIONS[key] maps the byte frequencies of a text to those of the
+# text xored with key
+_XOR_PERMUTATIONS = [
+    itemgetter(*(byte ^ key for byte in range(_NUM_BYTE_STATES)))
+    for key in range(_NUM_BYTE_STATES)]
+# _XOR_TABLES[key] is the bytes.translate table for xoring with key
+_XOR_TABLES = [
+    bytes(byte ^ key for byte in range(_NUM_BYTE_STATES))
+    for key in range(_NUM_BYTE_STATES)]
+
+
+def _floored(probabilities):
+    """Replace zero probabilities by a fraction of the smallest non-zero one"""
+    floor = min((prob for prob in probabilities if prob > 0), default=1) / 10
+    return [max(prob, floor) for prob in probabilities]
+
+
+class _Scorer(ABC):
+    """Scores texts by how unlike English they are, lower is better"""
+
+    @abstractmethod
+    def __call__(self, blob):
+        """Score of a single text"""
+
+    def score_many(self, candidates, width=None):
+        """
+        Scores of many texts in one call
+
+        :param candidates: An iterable of texts, or if width is given a single
+        buffer of candidates of that length packed back to back
+        :return: A list of scores in the order of the candidates
+        """
+        if width is not None:
+            candidates = BlockView(candidates, width)
+        return [self(candidate) for candidate in candidates]
+
+    def single_byte_xor_distances(self, blob):
+        """Scores of blob xored with each key byte, indexed by key"""
+        blob = bytes(blob)
+        return self.score_many(blob.translate(table) for table in _XOR_TABLES)
 
 
-class _TypeFrequencyPrototypeDistance:
+class _FunctionScorer(_Scorer):
 
-    def __init__(self, prototype):
-        self.prototype = _get_byte_frequencies(prototype)
+    def __init__(self, function):
+        self._function = function
 
     def __call__(self, blob):
-        return _byte_frequency_distance(_get_byte_frequencies(blob),
-                                        self.prototype)
+        return self._function(blob)
+
+
+class _UnigramScorer(_Scorer):
+    """Scorer looking only at byte frequencies, compared to a prototype"""
+
+    def __init__(self, prototype=None, prototype_file=None, model_file=None):
+        """
+        Prototype text given directly, or loaded on first use
+
+        A precompiled frequency model is preferred over the prototype file
+        if model_file exists (see frequency_model).
+        """
+        self._prototype_blob = prototype
+        self._prototype_file = prototype_file
+        self._model_file = model_file
+        self._prototype = None
+        self._table = None
+
+    @property
+    def prototype(self):
+        if self._prototype is None:
+            self._prototype = self._load_prototype()
+            self._prototype_blob = None
+        return self._prototype
+
+    def _load_prototype(self):
+        if self._prototype_blob is not None:
+            return _get_byte_frequencies(self._prototype_blob)
+        if self._model_file is not None and os.path.exists(self._model_file):
+            return load_model(self._model_file).frequencies
+        return _get_byte_frequencies(bytes_from_file(self._prototype_file))
+
+    @property
+    def table(self):
+        """Lookup table precomputed from the prototype"""
+        if self._table is None:
+            self._table = self._make_table(self.prototype)
+        return self._table
+
+    @abstractmethod
+    def _make_table(self, prototype):
+        """Precompute what _frequency_distance needs from the prototype"""
+
+    @abstractmethod
+    def _frequency_distance(self, frequencies, table):
+        """Distance of byte frequencies to the prototype's table"""
+
+    def __call__(self, blob):
+        return self.histogram_distance(_count_byte_occurrences(blob))
+
+    def histogram_distance(self, counts):
+        """Score of a text given by its 256 byte counts"""
+        return self._frequency_distance(_frequencies_from_counts(counts),
+                                        self.table)
+
+    def score_many(self, candidates, width=None):
+        if width is not None:
+            candidates = BlockView(candidates, width)
+        table = self.table
+        return [self._frequency_distance(_get_byte_frequencies(candidate),
+                                         table)
+                for candidate in candidates]
+
+    def single_byte_xor_distances(self, blob):
+        """Scores of blob xored with each key byte, indexed by key
+
+        Xoring with a single byte only permutes the byte histogram, so blob
+        is counted once and no decryption is ever built.
+        """
+        frequencies = _get_byte_frequencies(blob)
+        table = self.table
+        return [self._frequency_distance(permute(frequencies), table)
+                for permute in _XOR_PERMUTATIONS]
+
+
+class _TypeFrequencyPrototypeDistance(_UnigramScorer):
+    """Rms distance of the byte frequencies"""
+
+    def _make_table(self, prototype):
+        return prototype
+
+    def _frequency_distance(self, frequencies, table):
+        return _byte_frequency_distance(frequencies, table)
+
+
+class _ChiSquaredDistance(_UnigramScorer):
+    """Pearson's chi-squared statistic of the byte counts, per byte"""
+
+    def _make_table(self, prototype):
+        probabilities = _floored(prototype)
+        return ([1 / sqrt(prob) for prob in probabilities],
+                [sqrt(prob) for prob in probabilities])
+
+    def _frequency_distance(self, frequencies, table):
+        # sum((f - p)**2 / p) == dist(f / sqrt(p), sqrt(p))**2
+        inverse_roots, roots = table
+        return dist(list(map(mul, frequencies, inverse_roots)), roots) ** 2
+
+
+class _LogLikelihoodDistance(_UnigramScorer):
+    """Negative log-likelihood of the bytes under the prototype, per byte"""
+
+    def _make_table(self, prototype):
+        return [-log(prob) for prob in _floored(prototype)]
+
+    def _frequency_distance(self, frequencies, table):
+        return sum(map(mul, frequencies, table))
+
+
+class _NgramLogLikelihoodDistance(_Scorer):
+    """Negative log-likelihood of the byte n-grams, per n-gram"""
+
+    def __init__(self, size, prototype=None, prototype_file=None,
+                 model_file=None):
+        """Like _UnigramScorer; only bigrams can come from a model file"""
+        self.size = size
+        self._prototype_blob = prototype
+        self._prototype_file = prototype_file
+        self._model_file = model_file
+        self._table = None
+
+    @property
+    def table(self):
+        """Pair of a dict from n-gram to cost and the cost of unseen ones"""
+        if self._table is None:
+            self._table = self._make_table(self._load_probabilities())
+            self._prototype_blob = None
+        return self._table
+
+    def _load_probabilities(self):
+        blob = self._prototype_blob
+        if blob is None and self._model_file is not None \
+                and os.path.exists(self._model_file):
+            bigrams = load_model(self._model_file).bigram_frequencies
+            if self.size == 2 and bigrams is not None:
+                return {bytes(divmod(bigram, _NUM_BYTE_STATES)): prob
+                        for bigram, prob in enumerate(bigrams) if prob > 0}
+        if blob is None:
+            blob = bytes_from_file(self._prototype_file)
+        ngrams = Counter(self._ngrams(blob))
+        total = sum(ngrams.values())
+        return {ngram: count / total for ngram, count in ngrams.items()}
+
+    @staticmethod
+    def _make_table(probabilities):
+        costs = {ngram: -log(prob) for ngram, prob in probabilities.items()}
+        floor = min(probabilities.values(), default=1) / 10
+        return costs, -log(floor)
+
+    def _ngrams(self, blob):
+        return (blob[ii:ii + self.size]
+                for ii in range(len(blob) - self.size + 1))
+
+    def __call__(self, blob):
+        costs, unseen_cost = self.table
+        blob = bytes(blob)
+        num_ngrams = len(blob) - self.size + 1
+        if num_ngrams <= 0:
+            return unseen_cost
+        total = sum(map(costs.get, self._ngrams(blob), repeat(unseen_cost)))
+        return total / num_ngrams
 
 
 english_distance = _TypeFrequencyPrototypeDistance(
-    bytes_from_file("inputs/english_sample.txt"))
+    prototype_file=_ENGLISH_SAMPLE_FILE, model_file=_ENGLISH_MODEL_FILE)
 english_distance.__doc__ = \
     "Rms byte frequency distance of utf8 encoding to an english sample text "
+
+SCORERS = {}
+
+
+def register_scorer(name, scorer):
+    """Make a scorer available to the solvers under name"""
+    SCORERS[name] = scorer
+
+
+def get_scorer(scorer=None):
+    """
+    Resolve the scorer= argument of the solvers
+
+    :param scorer: None for english_distance, the name of a registered
+    scorer, or any callable mapping a text to a score (lower is better)
+    """
+    if scorer is None:
+        return english_distance
+    if isinstance(scorer, str):
+        try:
+            return SCORERS[scorer]
+        except KeyError:
+            raise ValueError("Unknown scorer " + scorer) from None
+    if isinstance(scorer, _Scorer):
+        return scorer
+    return _FunctionScorer(scorer)
+
+
+register_scorer("rms", english_distance)
+register_scorer("chi_squared", _ChiSquaredDistance(
+    prototype_file=_ENGLISH_SAMPLE_FILE, model_file=_ENGLISH_MODEL_FILE))
+register_scorer("log_likelihood", _LogLikelihoodDistance(
+    prototype_file=_ENGLISH_SAMPLE_FILE, model_file=_ENGLISH_MODEL_FILE))
+register_scorer("bigram", _NgramLogLikelihoodDistance(
+    2, prototype_file=_ENGLISH_SAMPLE_FILE, model_file=_ENGLISH_MODEL_FILE))
+register_scorer("trigram", _NgramLogLikelihoodDistance(
+    3, prototype_file=_ENGLISH_SAMPLE_FILE))
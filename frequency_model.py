@@ -0,0 +1,137 @@
+"""Precompiled byte frequency models
+
+A model file is a fixed header followed by little-endian doubles:
+
+* magic b"BFRQ", format version (uint16), flags (uint16) and the size of
+  the corpus in bytes (uint64),
+* 256 byte frequencies,
+* if flag 1 is set, 65536 bigram frequencies, indexed by
+  (first_byte << 8) | second_byte.
+
+Build one from a corpus of any size with
+
+    python frequency_model.py corpus.txt model.bin [--bigrams]
+"""
+__all__ = ["FrequencyModel", "build_model", "load_model", "save_model"]
+
+import argparse
+import struct
+import sys
+from array import array
+from collections import Counter, namedtuple
+
+from util import bytes_from_file
+
+MODEL_VERSION = 1
+_MAGIC = b"BFRQ"
+_HEADER = struct.Struct("<4sHHQ")
+_FLAG_BIGRAMS = 1
+_NUM_BYTE_STATES = 256
+_NUM_BIGRAM_STATES = _NUM_BYTE_STATES * _NUM_BYTE_STATES
+
+FrequencyModel = namedtuple(
+    "FrequencyModel",
+    ["frequencies", "corpus_size", "bigram_frequencies", "version"])
+
+
+def _frequencies_from_counter(counter, num_states, total):
+    frequencies = array("d", bytes(8 * num_states))
+    if total == 0:
+        return frequencies
+    for state, count in counter.items():
+        frequencies[state] = count / total
+    return frequencies
+
+
+def _little_endian_doubles(values):
+    doubles = array("d", values)
+    if sys.byteorder != "little":
+        doubles.byteswap()
+    return doubles.tobytes()
+
+
+def _doubles_from(blob, offset, count):
+    doubles = array("d")
+    doubles.frombytes(blob[offset:offset + 8 * count])
+    if sys.byteorder != "little":
+        doubles.byteswap()
+    return doubles
+
+
+def save_model(file_name, model):
+    flags = 0 if model.bigram_frequencies is None else _FLAG_BIGRAMS
+    with open(file_name, "bw") as file:
+        file.write(_HEADER.pack(
+            _MAGIC, MODEL_VERSION, flags, model.corpus_size))
+        file.write(_little_endian_doubles(model.frequencies))
+        if model.bigram_frequencies is not None:
+            file.write(_little_endian_doubles(model.bigram_frequencies))
+
+
+def load_model(file_name):
+    blob = bytes_from_file(file_name)
+    magic, version, flags, corpus_size = _HEADER.unpack_from(blob)
+    if magic != _MAGIC:
+        raise ValueError("Not a frequency model")
+    if version != MODEL_VERSION:
+        raise ValueError("Unsupported frequency model version")
+    size = _HEADER.size + 8 * _NUM_BYTE_STATES
+    if flags & _FLAG_BIGRAMS:
+        size += 8 * _NUM_BIGRAM_STATES
+    if len(blob) != size:
+        raise ValueError("Truncated frequency model")
+    frequencies = _doubles_from(blob, _HEADER.size, _NUM_BYTE_STATES)
+    bigram_frequencies = None
+    if flags & _FLAG_BIGRAMS:
+        bigram_frequencies = _doubles_from(
+            blob, _HEADER.size + 8 * _NUM_BYTE_STATES, _NUM_BIGRAM_STATES)
+    return FrequencyModel(frequencies, corpus_size, bigram_frequencies, version)
+
+
+def build_model(file, bigrams=False, chunk_size=1 << 20):
+    """Count a binary file object chunk by chunk, in bounded memory"""
+    counter = Counter()
+    bigram_counter = Counter()
+    corpus_size = 0
+    carry = b""
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        corpus_size += len(chunk)
+        counter.update(memoryview(chunk))
+        if bigrams:
+            # The carried byte pairs up with the first one of this chunk
+            joined = carry + chunk
+            bigram_counter.update(
+                (first << 8) | second
+                for first, second in zip(joined, memoryview(joined)[1:]))
+            carry = chunk[-1:]
+    bigram_frequencies = None
+    if bigrams:
+        bigram_frequencies = _frequencies_from_counter(
+            bigram_counter, _NUM_BIGRAM_STATES, max(corpus_size - 1, 0))
+    return FrequencyModel(
+        _frequencies_from_counter(counter, _NUM_BYTE_STATES, corpus_size),
+        corpus_size,
+        bigram_frequencies,
+        MODEL_VERSION)
+
+
+def _main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Build a byte frequency model from a corpus file")
+    parser.add_argument("corpus", help="corpus file, read in chunks")
+    parser.add_argument("model", help="model file to write")
+    parser.add_argument("--bigrams", action="store_true",
+                        help="also store the bigram table")
+    parser.add_argument("--chunk-size", type=int, default=1 << 20,
+                        help="bytes to read at a time")
+    args = parser.parse_args(args)
+    with open(args.corpus, "br") as corpus:
+        model = build_model(corpus, args.bigrams, args.chunk_size)
+    save_model(args.model, model)
+
+
+if __name__ == "__main__":
+    _main()
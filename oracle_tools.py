@@ -0,0 +1,132 @@
+"""Instrumentation for the oracles attacks query
+
+Wrap an oracle to see what an attack costs: how often it was called, how
+many of those calls actually reached the oracle, and how long they took.
+Answers of deterministic oracles are memoized, so repeated probes are free.
+
+    oracle = MeteredOracle(Challenge14Oracle(prefix, suffix))
+    Challenge14Solver(oracle).solve()
+    print(oracle.stats())
+
+For oracles that are methods, MeteredMethods wraps the named methods of an
+object and passes everything else through:
+
+    oracle = MeteredMethods(Challenge17Oracle(), ["check_padding"])
+    cbc_padding_crack(oracle, iv, encrypted)
+    print(oracle.check_padding.stats())
+"""
+__all__ = ["MeteredMethods", "MeteredOracle", "OracleStats"]
+
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+
+OracleStats = namedtuple(
+    "OracleStats", ["calls", "queries", "cache_hits", "latency_histogram"])
+OracleStats.__doc__ = """
+calls is how often the oracle was asked, queries how many of those reached
+it and cache_hits how many were answered from the cache. latency_histogram
+is a list of (upper bound in seconds, number of queries) pairs, for
+power-of-two buckets from one microsecond up.
+"""
+
+
+def _cache_key(args):
+    # bytearrays and other buffers aren't hashable, their contents are
+    return tuple(bytes(arg) if isinstance(arg, (bytearray, memoryview))
+                 else arg
+                 for arg in args)
+
+
+class MeteredOracle:
+    """
+    Callable wrapper around an oracle, counting queries and memoizing answers
+
+    :param cache_size: Maximum number of answers to remember, least recently
+    used first out. Use 0 for oracles that aren't deterministic, e.g. ones
+    that encrypt with random IVs.
+    """
+
+    def __init__(self, oracle, cache_size=1024):
+        self._oracle = oracle
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._latency_buckets = Counter()
+        self.calls = 0
+        self.queries = 0
+
+    def __call__(self, *args):
+        key = _cache_key(args) if self._cache_size else None
+        with self._lock:
+            self.calls += 1
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        # Not holding the lock while querying, so that concurrent queries
+        # can be in flight at the same time
+        start = time.perf_counter()
+        try:
+            answer = self._oracle(*args)
+        finally:
+            # Failed queries, e.g. timeouts, cost as much as answered ones
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.queries += 1
+                self._latency_buckets[int(elapsed * 1e6).bit_length()] += 1
+        if self._cache_size:
+            with self._lock:
+                self._cache[key] = answer
+                if len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+        return answer
+
+    @property
+    def cache_hits(self):
+        return self.calls - self.queries
+
+    def latency_histogram(self):
+        """See OracleStats"""
+        with self._lock:
+            return [(2 ** bucket / 1e6, count)
+                    for bucket, count in sorted(self._latency_buckets.items())]
+
+    def stats(self):
+        return OracleStats(
+            self.calls, self.queries, self.cache_hits,
+            self.latency_histogram())
+
+    def reset(self):
+        """Clear the counts, the histogram and the cache"""
+        with self._lock:
+            self._cache.clear()
+            self._latency_buckets.clear()
+            self.calls = 0
+            self.queries = 0
+
+
+class MeteredMethods:
+    """
+    Proxy for an oracle object whose named methods are wrapped in
+    MeteredOracle, all other attributes pass through
+
+    :param cache_size: See MeteredOracle, applies to every method
+    """
+
+    def __init__(self, oracle, method_names, cache_size=1024):
+        self._oracle = oracle
+        self.meters = {
+            name: MeteredOracle(getattr(oracle, name), cache_size)
+            for name in method_names}
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the proxy itself
+        meters = self.__dict__.get("meters", {})
+        if name in meters:
+            return meters[name]
+        return getattr(self._oracle, name)
+
+    @property
+    def queries(self):
+        """Queries that reached the oracle, over all metered methods"""
+        return sum(meter.queries for meter in self.meters.values())
@@ -1,26 +1,75 @@
 __all__ = [
     "xor_buffers",
     "xor_buffers_nonrepeating",
+    "xor_in_place",
     "break_single_byte_xor",
     "find_single_byte_xor",
-    "guess_xor_key_for_given_size"
+    "guess_xor_key_for_given_size",
+    "rank_repeating_xor_keysizes"
 ]
 
 import operator
+from functools import partial
+from math import inf
 
-from bitfiddle import xor_pairs, hamming_distance, byte_from_int, \
-    brake_into_keysize_blocks
-from english_distance import english_distance
-from util import nonrepeating_zip, repeating_zip, find_minimal, remove_nones
+from bitfiddle import BlockView, as_byte_view, hamming_distance, \
+    byte_from_int, brake_into_keysize_blocks, write_output
+from english_distance import get_scorer
+from util import find_minimal, parallel_map, remove_nones
 
 
-def xor_buffers(left, right):
-    """Xor two bytes-like objects, repeating the shorter as needed"""
-    return bytes(xor_pairs(repeating_zip(left, right)))
+def _tiled(blob, length):
+    """Repeat blob up to the given length"""
+    if len(blob) == length:
+        return blob
+    repeats, rest = divmod(length, len(blob))
+    return bytes(blob) * repeats + bytes(blob[:rest])
 
 
-def xor_buffers_nonrepeating(left, right):
-    return bytes(xor_pairs(nonrepeating_zip(left, right)))
+def _xor_same_length(left, right, length):
+    # One big integer XOR instead of a Python level loop over the bytes
+    xored = int.from_bytes(left, "little") ^ int.from_bytes(right, "little")
+    return xored.to_bytes(length, "little")
+
+
+def xor_buffers(left, right, out=None):
+    """
+    Xor two bytes-like objects, repeating the shorter as needed
+
+    :param out: Buffer to write the result to, see bitfiddle.output_view
+    """
+    left = as_byte_view(left)
+    right = as_byte_view(right)
+    if len(left) == 0 or len(right) == 0:
+        raise ValueError("Inputs can't be empty")
+    length = max(len(left), len(right))
+    return write_output(_xor_same_length(
+        _tiled(left, length), _tiled(right, length), length), out)
+
+
+def xor_buffers_nonrepeating(left, right, out=None):
+    """
+    Xor two bytes-like objects, truncating the longer
+
+    :param out: See xor_buffers
+    """
+    left = as_byte_view(left)
+    right = as_byte_view(right)
+    length = min(len(left), len(right))
+    return write_output(
+        _xor_same_length(left[:length], right[:length], length), out)
+
+
+def xor_in_place(buffer, key):
+    """Xor key into a writable buffer such as a bytearray, repeating the key"""
+    view = memoryview(buffer).cast("B")
+    length = len(view)
+    if length == 0:
+        return
+    key = as_byte_view(key)
+    if len(key) == 0:
+        raise ValueError("Key can't be empty")
+    view[:] = _xor_same_length(view, _tiled(key[:length], length), length)
 
 
 def _attempt_decode(blob):
@@ -31,57 +80,89 @@ def _attempt_decode(blob):
         return None
 
 
-def break_single_byte_xor(encrypted):
+def _best_single_byte_xor_key(encrypted, scorer=None):
+    """Key byte giving the most English decryption, and its score"""
+    distances = get_scorer(scorer).single_byte_xor_distances(encrypted)
+    best_key = min(range(256), key=distances.__getitem__)
+    return best_key, distances[best_key]
+
+
+def _single_byte_xor_decryption(key, encrypted):
+    key = byte_from_int(key)
+    return key, xor_buffers(key, encrypted)
+
+
+def break_single_byte_xor(encrypted, scorer=None):
     """
     Brute-force single-byte xor
 
     :param: encrypted UTF-8 encoded english text encrypted with single
     byte xor using an unknown key byte
+    :param scorer: See english_distance.get_scorer
     :return: A pair of the key leading to the best decryption based on
     similarity to English and that decryption. None if no decryption
     could be found.
     """
 
-    keys = (byte_from_int(ii) for ii in range(256))
-
-    def add_decryption(key):
-        return key, xor_buffers(key, encrypted)
+    key, _ = _best_single_byte_xor_key(encrypted, scorer)
+    return _single_byte_xor_decryption(key, encrypted)
 
-    candidates = (add_decryption(key) for key in keys)
 
-    def score(candidate):
-        return english_distance(candidate[1])
-
-    return find_minimal(candidates, score)
-
-
-def find_single_byte_xor(haystack):
+def find_single_byte_xor(haystack, workers=None, scorer=None):
     """
     Find and decrypt single-byte xor ciphertext
 
     :param haystack: a collection of bytes objects one of which is an
     UTF-8 encoded English text encrypte with single-byte xor using an
     unknown key byte
+    :param workers: Worker processes or executor for util.parallel_map
+    :param scorer: See english_distance.get_scorer
     :return: The decrypted text most similar to English or none if none
     was found
     """
 
-    candidate_decryptions = (break_single_byte_xor(blob) for blob in
-                             haystack)
+    haystack = list(haystack)
+    best_keys = parallel_map(
+        partial(_best_single_byte_xor_key, scorer=scorer), haystack, workers)
+    rated_blobs = zip(haystack, best_keys)
 
-    def score(decryption):
-        return english_distance(decryption[1])
+    def score(rated_blob):
+        return rated_blob[1][1]
 
-    return find_minimal(candidate_decryptions, score)
+    best = find_minimal(rated_blobs, score)
+    if best is None:
+        return None
+    blob, (key, _) = best
+    return _single_byte_xor_decryption(key, blob)
 
 
 def _rate_repeating_xor_keysize(ciphertext, size):
-    block1 = ciphertext[:size]
-    block2 = ciphertext[size:2 * size]
-    return hamming_distance(block1, block2) / size
+    """Hamming distance per byte between every block and the next one"""
+    # Comparing the ciphertext to itself shifted by one block covers all
+    # pairs of neighbouring blocks in a single pass
+    view = as_byte_view(ciphertext)
+    num_compared = len(view) - size
+    if num_compared <= 0:
+        return inf
+    return hamming_distance(view[:num_compared], view[size:]) / num_compared
+
+
+def rank_repeating_xor_keysizes(ciphertext, max_size):
+    """
+    Rate the plausible key sizes of repeating-key xor
+
+    :return: A list of (size, score) pairs for sizes below max_size, most
+    likely size first. Lower scores are better.
+    """
+    rated = [(size, _rate_repeating_xor_keysize(ciphertext, size)) for
+             size in range(1, max_size)]
+    return sorted(rated, key=operator.itemgetter(1))
 
 
 def _transpose_blocks(blocks):
+    if isinstance(blocks, BlockView) and len(blocks) > 0:
+        # Strided reads straight from the underlying buffer
+        return [blocks.column(ii) for ii in range(len(blocks[0]))]
     num_blocks = len(blocks)
     if num_blocks == 0:
         len_blocks = 1
@@ -99,25 +180,41 @@ def _transpose_blocks(blocks):
     return [create_block(ii) for ii in range(len_blocks)]
 
 
-def guess_xor_key_for_given_size(ciphertext, size):
+def _best_single_byte_xor_key_byte(encrypted, scorer=None):
+    return _best_single_byte_xor_key(encrypted, scorer)[0]
+
+
+def guess_xor_key_for_given_size(ciphertext, size, workers=None, scorer=None):
     sections = _transpose_blocks(brake_into_keysize_blocks(ciphertext, size))
-    decryptions = [break_single_byte_xor(section) for section in sections]
-    key_bytes = (decryption[0] for decryption in decryptions)
-    return b"".join(key_bytes)
+    return bytes(parallel_map(
+        partial(_best_single_byte_xor_key_byte, scorer=scorer),
+        sections,
+        workers))
 
 
-def break_repeating_key_xor(ciphertext, max_size):
-    rated = [(size, _rate_repeating_xor_keysize(ciphertext, size)) for
-             size in range(1, max_size)]
-    candidate_pairs = sorted(rated, key=operator.itemgetter(1))
-    candidates_sizes = [pair[0] for pair in candidate_pairs]
-    candidate_keys = [guess_xor_key_for_given_size(ciphertext, size) for
-                      size in candidates_sizes]
-    candidate__decryptions = (
-        (key, xor_buffers(key, ciphertext)) for key in candidate_keys)
-
-    def score(candidate):
-        plaintext = candidate[1]
-        return english_distance(plaintext)
-
-    return find_minimal(candidate__decryptions, score)
+def break_repeating_key_xor(ciphertext, max_size, top_k=None, workers=None,
+                            scorer=None):
+    """
+    Break repeating-key xor with a key shorter than max_size
+
+    :param top_k: Only recover keys for this many of the best rated key
+    sizes. All sizes are tried if None.
+    :param workers: Worker processes or executor for util.parallel_map,
+    which get one candidate key size each
+    :param scorer: See english_distance.get_scorer
+    :return: A pair of the key and the decryption most similar to English
+    """
+    ranked = rank_repeating_xor_keysizes(ciphertext, max_size)
+    candidates_sizes = [pair[0] for pair in ranked[:top_k]]
+    candidate_keys = parallel_map(
+        partial(guess_xor_key_for_given_size, bytes(ciphertext),
+                scorer=scorer),
+        candidates_sizes,
+        workers)
+    candidate__decryptions = [
+        (key, xor_buffers(key, ciphertext)) for key in candidate_keys]
+    scores = get_scorer(scorer).score_many(
+        plaintext for _, plaintext in candidate__decryptions)
+    best = find_minimal(
+        zip(candidate__decryptions, scores), operator.itemgetter(1))
+    return None if best is None else best[0]
@@ -1,38 +1,166 @@
 __all__ = [
+    "CtrKeystream",
+    "CtrTranscryptor",
+    "break_fixed_nonce_ctr",
     "ctr_transcrypt",
+    "ctr_transcrypt_many",
     "guess_shared_keystream_by_subst"
 ]
 
 # noinspection PyPackageRequirements
 # false alert, is in requirements as pycryptodome
 from Crypto.Cipher import AES
+# noinspection PyPackageRequirements
+from Crypto.Util import Counter
 
-from bitfiddle import brake_into_keysize_blocks
-from primitive_crypt import xor_buffers
+from bitfiddle import PackedBlobs, as_byte_view, output_view, write_output
+from block_crypt import PARALLEL_MIN_LENGTH, ecb_cipher
+from primitive_crypt import guess_xor_key_for_given_size, xor_in_place
 from primitive_crypt import xor_buffers_nonrepeating
-from util import find_minimal
+from util import check_thread_workers, find_minimal, parallel_ranges
+
+
+def _nonce_bytes(nonce):
+    if nonce < 0 or nonce >= 2 ** 64:
+        raise ValueError()
+    return nonce.to_bytes(8, byteorder="little", signed=False)
 
 
 def ctr_keystream(key, nonce, block_count):
-    if nonce < 0 or nonce > 2 ** 64 or block_count < 0 or block_count > 2 ** 64:
+    if block_count < 0 or block_count > 2 ** 64:
         raise ValueError()
-    plain_nonce = nonce.to_bytes(8, byteorder="little", signed=False)
+    plain_nonce = _nonce_bytes(nonce)
     plain_count = block_count.to_bytes(8, byteorder="little", signed=False)
     plain = plain_nonce + plain_count
-    cipher = AES.new(key, AES.MODE_ECB)
-    return cipher.encrypt(plain)
+    return ecb_cipher(key).encrypt(plain)
+
+
+def _ctr_cipher(key, nonce_bytes, block_count):
+    counter = Counter.new(
+        64, prefix=nonce_bytes, initial_value=block_count, little_endian=True)
+    return AES.new(key, AES.MODE_CTR, counter=counter)
+
+
+class CtrKeystream:
+    """
+    Random access to the CTR keystream for key and nonce
+
+    keystream[start:stop] computes only the blocks covering that range, so
+    a slice in the middle of a huge ciphertext can be decrypted on its own.
+    """
+
+    _MAX_LENGTH = 16 * 2 ** 64
+
+    def __init__(self, key, nonce):
+        self._key = bytes(key)
+        self._nonce_bytes = _nonce_bytes(nonce)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step not in (None, 1):
+                raise ValueError("Keystream slices must be contiguous")
+            start = 0 if index.start is None else index.start
+            if index.stop is None:
+                raise ValueError("The keystream is practically endless")
+            return self.transcrypt(bytes(max(index.stop - start, 0)), start)
+        if index < 0 or index >= self._MAX_LENGTH:
+            raise IndexError("Keystream index out of range")
+        return self.transcrypt(bytes(1), index)[0]
+
+    def transcrypt(self, data, offset=0, workers=None, out=None):
+        """
+        Encrypt or decrypt data that sits at offset in the CTR stream
+
+        :param offset: Position of data[0] in the plaintext/cyphertext
+        :param workers: Number of threads or a ThreadPoolExecutor to
+        transcrypt data of at least PARALLEL_MIN_LENGTH bytes with. The
+        threads write into one shared buffer, so process pools are
+        rejected, see util.parallel_ranges.
+        :param out: Buffer to write to instead of returning new bytes, see
+        bitfiddle.output_view
+        """
+        check_thread_workers(workers)
+        view = as_byte_view(data)
+        if offset < 0 or offset + len(view) > self._MAX_LENGTH:
+            raise ValueError("Range exceeds the keystream")
+        if len(view) == 0:
+            return write_output(b'', out)
+        serial = workers is None or len(view) < PARALLEL_MIN_LENGTH
+        if serial and out is None:
+            return self._cipher_at(offset).encrypt(view)
+        out_view = output_view(
+            bytearray(len(view)) if out is None else out, len(view))
+        if serial:
+            self._cipher_at(offset).encrypt(view, output=out_view)
+        else:
+            def transcrypt_range(start, stop):
+                # Each range gets its own cipher, started at its first block
+                self._cipher_at(offset + start).encrypt(
+                    view[start:stop], output=out_view[start:stop])
 
+            parallel_ranges(
+                transcrypt_range, len(view), workers, alignment=16)
+        return bytes(out_view) if out is None else out_view
 
-def ctr_transcrypt(key, nonce, data):
-    instream = brake_into_keysize_blocks(data, 16)
-    num_blocks = len(instream)
-    if num_blocks == 0:
+    def _cipher_at(self, offset):
+        block_count, skip = divmod(offset, 16)
+        cipher = _ctr_cipher(self._key, self._nonce_bytes, block_count)
+        if skip:
+            cipher.encrypt(bytes(skip))
+        return cipher
+
+
+def ctr_transcrypt(key, nonce, data, workers=None, out=None):
+    """:param workers, out: See CtrKeystream.transcrypt"""
+    return CtrKeystream(key, nonce).transcrypt(
+        data, workers=workers, out=out)
+
+
+def ctr_transcrypt_many(key, nonces, datas):
+    """
+    ctr_transcrypt for each nonce and data, in a single AES call
+
+    The counter blocks of all messages are packed into one buffer and
+    encrypted at once, which beats a CTR cipher setup per short message.
+
+    :return: PackedBlobs of the results
+    """
+    nonces = list(nonces)
+    datas = list(datas)
+    if len(nonces) != len(datas):
+        raise ValueError("Need one nonce per data")
+    counter_blocks = []
+    parts = []
+    bounds = []
+    position = 0
+    for nonce, data in zip(nonces, datas):
+        nonce_bytes = _nonce_bytes(nonce)
+        num_blocks = -(-len(data) // 16)
+        counter_blocks.extend(
+            nonce_bytes + block_count.to_bytes(8, byteorder="little")
+            for block_count in range(num_blocks))
+        # Padded to whole blocks so the keystreams line up
+        parts.append(data)
+        parts.append(bytes(-len(data) % 16))
+        bounds.append((position, position + len(data)))
+        position += 16 * num_blocks
+    keystream = ecb_cipher(key).encrypt(b''.join(counter_blocks))
+    out = bytearray(b''.join(parts))
+    xor_in_place(out, keystream)
+    return PackedBlobs(out, bounds)
+
+
+class CtrTranscryptor:
+    """Incremental ctr_transcrypt, for chunks of any size"""
+
+    def __init__(self, key, nonce):
+        self._cipher = _ctr_cipher(key, _nonce_bytes(nonce), 0)
+
+    def update(self, chunk):
+        return self._cipher.encrypt(chunk)
+
+    def finalize(self):
         return b''
-    keystream = [ctr_keystream(key, nonce, i) for i in range(num_blocks)]
-    keystream[-1] = keystream[-1][:len(instream[-1])]
-    outstream = [xor_buffers(instream[i], keystream[i])
-                 for i in range(num_blocks)]
-    return b''.join(outstream)
 
 
 def guess_shared_keystream_by_subst(cyphertexts, guesses):
@@ -50,3 +178,17 @@ def guess_shared_keystream_by_subst(cyphertexts, guesses):
 
     return bytes(guessed_keystream)
 
+
+def break_fixed_nonce_ctr(cyphertexts, workers=None, scorer=None):
+    """
+    Guess the keystream shared by CTR cyphertexts, treating them as
+    repeating-key xor
+
+    :param scorer: See english_distance.get_scorer
+    :return: The keystream, as long as the shortest cyphertext
+    """
+    min_length = min(len(cyphertext) for cyphertext in cyphertexts)
+    composite_cyphertext = b"".join(
+        cyphertext[:min_length] for cyphertext in cyphertexts)
+    return guess_xor_key_for_given_size(
+        composite_cyphertext, min_length, workers=workers, scorer=scorer)
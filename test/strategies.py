@@ -1,3 +1,4 @@
+import hypothesis
 from hypothesis.strategies import *
 
 from block_crypt import pad_pkcs_7
@@ -101,9 +102,18 @@ def non_pkcs7_padded_blob(draw, blocksize):
         filter(lambda x: x != padding[change_loc])
     replacement_byte = draw(replacement_byte_strat)
     padding[change_loc] = replacement_byte
+    # A new last byte n is still valid padding if the n - 1 bytes before it
+    # happen to be n as well, e.g. b'\x02\x01' changed to b'\x02\x02'
+    hypothesis.assume(not _is_pkcs7_padded(blob + padding))
     return blob + padding
 
 
+def _is_pkcs7_padded(blob):
+    num_padding = blob[-1]
+    return 0 < num_padding <= len(blob) and \
+        all(byte == num_padding for byte in blob[-num_padding:])
+
+
 @composite
 def non_pkcs7_padded_blocksize_and_blob(draw):
     blocksize = draw(integers(min_value=1, max_value=255))
@@ -1,3 +1,5 @@
+import mmap
+
 import hypothesis as hyp
 import pytest
 
@@ -168,6 +170,30 @@ class TestHammingDistance:
         assert bf.hamming_distance([1, 2, 3], [0, 5, 5]) == 6
 
 
+class TestHammingMatrix:
+
+    def test_empty(self):
+        assert bf.hamming_matrix([]) == []
+
+    def test_example(self):
+        assert bf.hamming_matrix([b"bla", b"alb", b"BLA"]) == \
+               [[0, 4, 3], [4, 0, 7], [3, 7, 0]]
+
+    def test_different_length(self):
+        with pytest.raises(ValueError):
+            bf.hamming_matrix([b"bla", b"bl"])
+
+    @hyp.given(strategies.list_of_same_size_binaries(
+        min_length=0,
+        max_length=5)
+    )
+    def test_matches_hamming_distance(self, list_):
+        matrix = bf.hamming_matrix(list_)
+        for ii, left in enumerate(list_):
+            for jj, right in enumerate(list_):
+                assert matrix[ii][jj] == bf.hamming_distance(left, right)
+
+
 class TestBrakeIntoKeysizeBlocks:
 
     def test_example(self):
@@ -177,3 +203,82 @@ class TestBrakeIntoKeysizeBlocks:
     def test_rest(self):
         assert bf.brake_into_keysize_blocks(b"blablobl", 3) == \
                [b"bla", b"blo", b"bl"]
+
+    def test_lazy_views(self):
+        blob = bytearray(b"blablobl")
+        blocks = bf.brake_into_keysize_blocks(blob, 3)
+        blob[0:3] = b"BLA"
+        assert blocks[0] == b"BLA"
+
+    def test_indexing(self):
+        blocks = bf.brake_into_keysize_blocks(b"blablobl", 3)
+        assert len(blocks) == 3
+        assert blocks[-1] == b"bl"
+        assert blocks[1:] == [b"blo", b"bl"]
+        with pytest.raises(IndexError):
+            blocks[3]
+
+    def test_hashable_blocks(self):
+        blocks = bf.brake_into_keysize_blocks(b"blablabl", 3)
+        assert len(set(blocks.hashable_blocks())) == 2
+        assert b"bla" in set(blocks.hashable_blocks())
+        blocks = bf.brake_into_keysize_blocks(bytearray(b"\0\0\0\0"), 3)
+        assert len(set(blocks.hashable_blocks())) == 2
+
+    def test_mmap(self, tmp_path):
+        path = tmp_path / "blob"
+        path.write_bytes(b"blablobliblu")
+        with open(path, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as map_:
+                blocks = bf.brake_into_keysize_blocks(map_, 3)
+                assert blocks == [b"bla", b"blo", b"bli", b"blu"]
+                assert blocks.column(2) == b"aoiu"
+                del blocks
+
+    @hyp.given(strategies.binary_and_possible_blocksize())
+    def test_join_round_trip(self, args):
+        blob, blocksize = args
+        blocks = bf.brake_into_keysize_blocks(blob, blocksize)
+        assert b"".join(blocks) == blob
+
+
+class TestPackedBlobs:
+    def test_items(self):
+        packed = bf.PackedBlobs(b"abcdef", [(0, 2), (2, 2), (3, 6)])
+        assert len(packed) == 3
+        assert packed == [b"ab", b"", b"def"]
+        assert packed[-1] == b"def"
+        assert packed[:2] == [b"ab", b""]
+
+    def test_read_only(self):
+        packed = bf.PackedBlobs(bytearray(b"abc"), [(0, 3)])
+        with pytest.raises(TypeError):
+            packed[0][0] = 0
+
+
+class TestOutput:
+    def test_write_output(self):
+        assert bf.write_output(b"abc", None) == b"abc"
+        out = bytearray(5)
+        assert bf.write_output(b"abc", out) == b"abc"
+        assert out == b"abc\0\0"
+
+    def test_output_view_checks(self):
+        with pytest.raises(ValueError):
+            bf.output_view(bytearray(2), 3)
+        with pytest.raises(TypeError):
+            bf.output_view(b"abc", 3)
+
+    def test_join_into_reuses(self):
+        buffer = bytearray()
+        with bf.join_into(buffer, [b"ab", memoryview(b"cd")]) as joined:
+            assert joined == b"abcd"
+        with bf.join_into(buffer, [b"e"]) as joined:
+            assert joined == b"e"
+        assert len(buffer) == 4
+
+    def test_column_out(self):
+        out = bytearray(3)
+        assert bf.brake_into_keysize_blocks(b"abcdef", 2).column(
+            1, out=out) == b"bdf"
+        assert out == b"bdf"
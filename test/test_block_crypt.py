@@ -1,7 +1,11 @@
+import mmap
+from contextlib import contextmanager
+
 import hypothesis as hyp
 import pytest
 
 import block_crypt as bc
+import util
 from . import strategies
 
 
@@ -40,6 +44,7 @@ class TestPadPkcs7:
         assert (len(padded) % blocksize) == 0
         stripped = bc.strip_pkcs_7(padded)
         assert blob == stripped
+        assert padded == blob + bc.pkcs_7_padding(len(blob), blocksize)
 
     @hyp.given(
         args=strategies.non_pkcs7_padded_blocksize_and_blob()
@@ -48,6 +53,29 @@ class TestPadPkcs7:
         with pytest.raises(bc.InvalidPaddingError):
             bc.strip_pkcs_7(args[1])
 
+    def test_strip_views(self):
+        padded = bytearray(b'bla\x02\x02')
+        assert bc.strip_pkcs_7(padded) == b'bla'
+        assert bc.strip_pkcs_7(memoryview(padded)) == b'bla'
+
+    @hyp.given(
+        blobs=strategies.lists(strategies.binary(max_size=40)),
+        bad=strategies.non_pkcs7_padded_blocksize_and_blob()
+    )
+    def test_many_match_single(self, blobs, bad):
+        padded = [bc.pad_pkcs_7(blob, 16) for blob in blobs]
+        messages = padded + [bad[1]] + blobs
+        expected = []
+        for message in messages:
+            try:
+                expected.append(bc.strip_pkcs_7(message))
+            except bc.InvalidPaddingError:
+                expected.append(None)
+        assert bc.strip_pkcs_7_many(messages) == expected
+        assert bc.check_pkcs_7_many(messages) == \
+               [stripped is not None for stripped in expected]
+        assert expected[:len(blobs) + 1] == blobs + [None]
+
 
 @hyp.given(
     key=strategies.binary(min_size=16, max_size=16),
@@ -68,3 +96,248 @@ def test_cbc_roundtrip(key, iv, plaintext):
     encrypted = bc.cbc_encrypt(key, iv, plaintext)
     decrypted = bc.cbc_decrypt(key, iv, encrypted)
     assert plaintext == decrypted
+
+
+@hyp.given(
+    key=strategies.binary(min_size=16, max_size=16),
+    iv=strategies.binary(min_size=16, max_size=16),
+    plaintext=strategies.binary()
+)
+def test_cbc_matches_reference(key, iv, plaintext):
+    encrypted = bc.cbc_encrypt(key, iv, plaintext)
+    assert encrypted == bc.cbc_encrypt(key, iv, plaintext, reference=True)
+    assert bc.cbc_decrypt(key, iv, encrypted, reference=True) == plaintext
+
+
+def _feed_in_chunks(transformer, blob, cuts):
+    pieces = []
+    start = 0
+    for cut in sorted(cuts) + [len(blob)]:
+        pieces.append(transformer.update(blob[start:max(cut, start)]))
+        start = max(cut, start)
+    pieces.append(transformer.finalize())
+    return b''.join(pieces)
+
+
+class TestIncremental:
+
+    @hyp.given(
+        key=strategies.binary(min_size=16, max_size=16),
+        plaintext=strategies.binary(max_size=100),
+        cuts=strategies.lists(strategies.integers(min_value=0, max_value=100))
+    )
+    def test_ecb(self, key, plaintext, cuts):
+        encrypted = _feed_in_chunks(bc.EcbEncryptor(key), plaintext, cuts)
+        assert encrypted == bc.ecb_encrypt(key, plaintext)
+        decrypted = _feed_in_chunks(bc.EcbDecryptor(key), encrypted, cuts)
+        assert decrypted == plaintext
+
+    @hyp.given(
+        key=strategies.binary(min_size=16, max_size=16),
+        iv=strategies.binary(min_size=16, max_size=16),
+        plaintext=strategies.binary(max_size=100),
+        cuts=strategies.lists(strategies.integers(min_value=0, max_value=100))
+    )
+    def test_cbc(self, key, iv, plaintext, cuts):
+        encrypted = _feed_in_chunks(bc.CbcEncryptor(key, iv), plaintext, cuts)
+        assert encrypted == bc.cbc_encrypt(key, iv, plaintext)
+        decrypted = _feed_in_chunks(bc.CbcDecryptor(key, iv), encrypted, cuts)
+        assert decrypted == plaintext
+
+    def test_bad_padding(self):
+        decryptor = bc.EcbDecryptor(bytes(16))
+        decryptor.update(bc.ecb_encrypt(bytes(16), b'bla')[:-1])
+        with pytest.raises(ValueError):
+            decryptor.finalize()
+        with pytest.raises(bc.InvalidPaddingError):
+            bc.EcbDecryptor(bytes(16)).finalize()
+
+    def test_file(self, tmp_path):
+        key = bytes(range(16))
+        plaintext = bytes(range(256)) * 100
+        (tmp_path / "plain").write_bytes(plaintext)
+        util.transform_file(bc.CbcEncryptor(key, bytes(16)),
+                            tmp_path / "plain", tmp_path / "encrypted",
+                            chunk_size=1000)
+        encrypted = (tmp_path / "encrypted").read_bytes()
+        assert encrypted == bc.cbc_encrypt(key, bytes(16), plaintext)
+
+
+class TestCipherCache:
+
+    def test_hits(self):
+        key = b"CACHE TEST KEY!!"
+        bc.ecb_encrypt(key, b"bla")
+        before = bc.cipher_cache_info()
+        bc.ecb_decrypt(bytearray(key), bc.ecb_encrypt(key, b"bla"))
+        after = bc.cipher_cache_info()
+        assert after.hits == before.hits + 2
+        assert after.misses == before.misses
+
+    def test_clear(self):
+        bc.ecb_encrypt(b"CACHE TEST KEY!!", b"bla")
+        bc.clear_cipher_cache()
+        assert bc.cipher_cache_info().currsize == 0
+
+
+# Lengths around _CBC_KEY_SETUP_AMORTIZED_LENGTH, fixed rather than drawn
+# by hypothesis, which is slow to generate this much data
+@pytest.mark.parametrize("length", [1000, 1007, 1023, 1024, 1040, 1100])
+def test_cbc_roundtrip_long(length):
+    key = util.random_blob(16, 16)
+    iv = util.random_blob(16, 16)
+    plaintext = util.random_blob(length, length)
+    encrypted = bc.cbc_encrypt(key, iv, plaintext)
+    assert bc.cbc_decrypt(key, iv, encrypted) == plaintext
+
+
+@pytest.mark.parametrize("extra", [0, 5, 16])
+def test_ecb_parallel(extra):
+    key = b"YELLOW SUBMARINE"
+    plaintext = util.random_blob(
+        bc.PARALLEL_MIN_LENGTH + extra, bc.PARALLEL_MIN_LENGTH + extra)
+    encrypted = bc.ecb_encrypt(key, plaintext, workers=3)
+    assert encrypted == bc.ecb_encrypt(key, plaintext)
+    assert bc.ecb_decrypt(key, encrypted, workers=3) == plaintext
+
+
+def test_parallel_needs_threads():
+    with pytest.raises(TypeError):
+        bc.ecb_encrypt(b"YELLOW SUBMARINE", b"short", workers="3")
+    with pytest.raises(TypeError):
+        bc.cbc_decrypt(b"YELLOW SUBMARINE", bytes(16), bytes(32),
+                       workers=3.0)
+
+
+@pytest.mark.parametrize("extra", [0, 5, 16])
+def test_cbc_decrypt_parallel(extra):
+    key = b"YELLOW SUBMARINE"
+    iv = bytes(range(16))
+    plaintext = util.random_blob(
+        bc.PARALLEL_MIN_LENGTH + extra, bc.PARALLEL_MIN_LENGTH + extra)
+    encrypted = bc.cbc_encrypt(key, iv, plaintext)
+    assert bc.cbc_decrypt(key, iv, encrypted, workers=3) == plaintext
+
+
+def test_cbc_decrypt_parallel_bad_padding():
+    key = b"YELLOW SUBMARINE"
+    iv = bytes(16)
+    encrypted = bc.cbc_encrypt_prepadded(
+        key, iv, bytes(bc.PARALLEL_MIN_LENGTH))
+    with pytest.raises(bc.InvalidPaddingError):
+        bc.cbc_decrypt(key, iv, encrypted, workers=3)
+
+
+class TestMany:
+    key = b"YELLOW SUBMARINE"
+
+    @hyp.given(plaintexts=strategies.lists(strategies.binary(max_size=50)))
+    def test_ecb_encrypt_many(self, plaintexts):
+        encrypted = bc.ecb_encrypt_many(self.key, plaintexts)
+        assert encrypted == [bc.ecb_encrypt(self.key, plaintext)
+                             for plaintext in plaintexts]
+
+    @hyp.given(
+        messages=strategies.lists(strategies.tuples(
+            strategies.binary(min_size=16, max_size=16),
+            strategies.binary(max_size=50)))
+    )
+    def test_cbc_many(self, messages):
+        ivs = [iv for iv, _ in messages]
+        plaintexts = [plaintext for _, plaintext in messages]
+        encrypted = bc.cbc_encrypt_many(self.key, ivs, plaintexts)
+        assert encrypted == [bc.cbc_encrypt(self.key, iv, plaintext)
+                             for iv, plaintext in messages]
+        assert bc.cbc_decrypt_many(self.key, ivs, encrypted) == plaintexts
+
+    def test_cbc_many_views(self):
+        # e.g. BlockView blocks and PackedBlobs items
+        ivs = [memoryview(bytes(range(16))), memoryview(bytes(16))]
+        plaintexts = [b"first", b"the second plaintext"]
+        encrypted = bc.cbc_encrypt_many(self.key, ivs, plaintexts)
+        assert bc.cbc_decrypt_many(
+            self.key, ivs, [memoryview(blob) for blob in encrypted]) == \
+               plaintexts
+
+    def test_cbc_decrypt_many_bad_padding(self):
+        iv = bytes(16)
+        encrypted = [bc.cbc_encrypt(self.key, iv, b"fine"),
+                     bc.cbc_encrypt_prepadded(self.key, iv, bytes(16))]
+        with pytest.raises(bc.InvalidPaddingError):
+            bc.cbc_decrypt_many(self.key, [iv, iv], encrypted)
+        with pytest.raises(bc.InvalidPaddingError):
+            bc.cbc_decrypt_many(self.key, [iv], [b''])
+
+    def test_mismatched_ivs(self):
+        with pytest.raises(ValueError):
+            bc.cbc_encrypt_many(self.key, [bytes(16)], [b'a', b'b'])
+        with pytest.raises(ValueError):
+            bc.cbc_decrypt_many(self.key, [bytes(15)], [bytes(16)])
+
+
+@contextmanager
+def _mapped(tmp_path, blob):
+    path = tmp_path / "blob"
+    path.write_bytes(blob)
+    with open(path, "rb") as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as map_:
+        yield map_
+
+
+# Short, at least _CBC_KEY_SETUP_AMORTIZED_LENGTH and parallel
+@pytest.mark.parametrize("length, workers", [
+    (40, None), (1100, None), (bc.PARALLEL_MIN_LENGTH + 5, 2)])
+def test_decrypt_mmap(tmp_path, length, workers):
+    key = b"YELLOW SUBMARINE"
+    iv = bytes(range(16))
+    plaintext = util.random_blob(length, length)
+    encrypted = bc.ecb_encrypt(key, plaintext)
+    with _mapped(tmp_path, encrypted) as map_:
+        assert bc.ecb_decrypt(key, map_, workers=workers) == plaintext
+    encrypted = bc.cbc_encrypt(key, iv, plaintext)
+    with _mapped(tmp_path, encrypted) as map_:
+        assert bc.cbc_decrypt(key, iv, map_, workers=workers) == plaintext
+
+
+class TestOut:
+    key = b"YELLOW SUBMARINE"
+    iv = bytes(range(16))
+
+    @hyp.given(plaintext=strategies.binary(max_size=50))
+    def test_ecb(self, plaintext):
+        out = bytearray(80)
+        encrypted = bc.ecb_encrypt(self.key, memoryview(plaintext), out=out)
+        assert encrypted == bc.ecb_encrypt(self.key, plaintext)
+        decrypt_out = bytearray(len(encrypted))
+        assert bc.ecb_decrypt(self.key, encrypted, out=decrypt_out) == \
+               plaintext
+
+    @hyp.given(plaintext=strategies.binary(max_size=2000),
+               reference=strategies.booleans())
+    def test_cbc(self, plaintext, reference):
+        out = bytearray(2016)
+        encrypted = bc.cbc_encrypt(self.key, self.iv, bytearray(plaintext),
+                                   reference=reference, out=out)
+        assert encrypted == bc.cbc_encrypt(self.key, self.iv, plaintext)
+        decrypt_out = bytearray(len(encrypted))
+        assert bc.cbc_decrypt(self.key, self.iv, encrypted,
+                              reference=reference, out=decrypt_out) == \
+               plaintext
+
+    def test_parallel(self):
+        plaintext = bytes(bc.PARALLEL_MIN_LENGTH)
+        out = bytearray(len(plaintext) + 16)
+        encrypted = bc.cbc_encrypt(self.key, self.iv, plaintext)
+        assert bc.cbc_decrypt(self.key, self.iv, encrypted, workers=2,
+                              out=out) == plaintext
+        assert bc.ecb_encrypt(self.key, plaintext, workers=2, out=out) == \
+               bc.ecb_encrypt(self.key, plaintext)
+
+    def test_out_too_small(self):
+        with pytest.raises(ValueError):
+            bc.ecb_encrypt(self.key, bytes(16), out=bytearray(16))
+
+    def test_pad_views(self):
+        assert bc.pad_pkcs_7(memoryview(b"bla"), 4) == b"bla\x01"
+        out = bytearray(8)
+        assert bc.pad_pkcs_7(b"bla", 4, out=out) == b"bla\x01"
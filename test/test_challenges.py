@@ -1,4 +1,5 @@
 import base64
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import hypothesis as hyp
 import hypothesis.strategies as strat
@@ -155,6 +156,61 @@ def test_challenge_14(prefix, suffix):
     assert solver.solve() == suffix
 
 
+class _CountingOracle:
+    def __init__(self, oracle):
+        self.oracle = oracle
+        self.calls = 0
+
+    def __call__(self, input_blob):
+        self.calls += 1
+        return self.oracle(input_blob)
+
+
+@hyp.settings(deadline=None, max_examples=20)
+@hyp.given(prefix=strat.binary(max_size=40),
+           suffix=strat.binary(min_size=1, max_size=40))
+def test_challenge_14_batched(prefix, suffix):
+    oracle = _CountingOracle(cs.Challenge14Oracle(prefix=prefix, suffix=suffix))
+    solver = cs.Challenge14Solver(oracle)
+    calls_before = oracle.calls
+    assert solver.setup_queries == calls_before
+    # One probe for no arg, up to five doubling and three bisecting the
+    # arg length, one more for a different byte, two for a prefix ending at
+    # a block border and two each for four bisection steps over the prefix
+    # padding
+    assert calls_before <= 20
+    assert solver.solve(batched=True) == suffix
+    assert oracle.calls - calls_before == len(suffix)
+    assert solver.solve(batched=False) == suffix
+    assert solver.solve(batched=False, workers=4) == suffix
+    with ProcessPoolExecutor(1) as executor, pytest.raises(TypeError):
+        solver.solve(workers=executor)
+    with pytest.raises(TypeError):
+        solver.guess_next_byte(b"", workers="4")
+
+
+@pytest.mark.parametrize("prefix_length", [1, 5, 15, 16, 17])
+@pytest.mark.parametrize("suffix_run", [1, 5, 19])
+@pytest.mark.parametrize("fillers", [b"AB", b"BA"])
+def test_challenge_14_prefix_and_suffix_of_filler_bytes(
+        prefix_length, suffix_run, fillers):
+    # The prefix ends in one filler byte and the suffix starts with the other
+    prefix = fillers[:1] * prefix_length
+    suffix = fillers[1:] * suffix_run + b"xyz"
+    solver = cs.Challenge14Solver(cs.Challenge14Oracle(prefix, suffix))
+    assert solver.prefix_length == len(prefix)
+    assert solver.suffix_length == len(suffix)
+    assert solver.solve() == suffix
+
+
+def test_challenge_14_oracle_pads_like_ecb_encrypt():
+    oracle = cs.Challenge14Oracle(b"prefix", b"suffix!")
+    for length in range(20):
+        input_blob = bytes(range(length))
+        assert oracle(input_blob) == bc.ecb_encrypt(
+            oracle._key, b"prefix" + input_blob + b"suffix!")
+
+
 def test_challenge_15():
     assert bc.strip_pkcs_7(b"ICE ICE BABY\x04\x04\x04\x04") == b"ICE ICE BABY"
     with pytest.raises(bc.InvalidPaddingError):
@@ -187,6 +243,46 @@ class TestChallenge17:
     def test_random_line(self, line):
         assert not self.oracle.check_line_possible(line)
 
+    @pytest.mark.parametrize("guess_workers", [None, 4])
+    def test_crack_prepadded(self, guess_workers):
+        plaintext = b"Cooking MC's like a pound of bacon"
+        iv, encrypted = self.oracle.encrypt_prepadded_input(
+            bc.pad_pkcs_7(plaintext, 16))
+        assert cs.cbc_padding_crack(
+            self.oracle, iv, encrypted, guess_workers=guess_workers) == \
+               plaintext
+
+    @pytest.mark.parametrize("workers", [None, 3])
+    def test_crack_progress(self, workers):
+        plaintext = b"Cooking MC's like a pound of bacon"
+        iv, encrypted = self.oracle.encrypt_prepadded_input(
+            bc.pad_pkcs_7(plaintext, 16))
+        reported = []
+        assert cs.cbc_padding_crack(
+            self.oracle, iv, encrypted, workers=workers,
+            progress=lambda block, num_bytes: reported.append(
+                (block, num_bytes))) == plaintext
+        assert sorted(reported) == [(block, num_bytes)
+                                    for block in range(3)
+                                    for num_bytes in range(1, 17)]
+
+    def test_crack_thread_pool(self):
+        plaintext = b"Cooking MC's like a pound of bacon"
+        iv, encrypted = self.oracle.encrypt_prepadded_input(
+            bc.pad_pkcs_7(plaintext, 16))
+        with ThreadPoolExecutor(2) as executor:
+            assert cs.cbc_padding_crack(
+                self.oracle, iv, encrypted, workers=executor) == plaintext
+
+    def test_crack_rejects_process_pool(self):
+        iv, encrypted = self.oracle.encrypt_prepadded_input(bytes(16 * [16]))
+        with ProcessPoolExecutor(1) as executor, pytest.raises(TypeError):
+            cs.cbc_padding_crack(self.oracle, iv, encrypted,
+                                 workers=executor)
+        with ProcessPoolExecutor(1) as executor, pytest.raises(TypeError):
+            cs.cbc_padding_crack(self.oracle, iv, encrypted,
+                                 guess_workers=executor)
+
     def test_crack(self):
         iv, encrypted = self.oracle.get_encrypted()
         decrypted = cs.cbc_padding_crack(self.oracle, iv, encrypted)
@@ -221,15 +317,13 @@ def test_challenge_20():
     key = util.random_blob(16, 16)
     cyphertexts = [sc.ctr_transcrypt(key, nonce, plaintext) for plaintext in plaintexts]
     min_length = min((len(cyphertext) for cyphertext in cyphertexts))
-    truncated_cyphertexts = (cyphertext[:min_length] for cyphertext in cyphertexts)
-    composite_cyphertext = b"".join(truncated_cyphertexts)
-    keystream = pc.guess_xor_key_for_given_size(composite_cyphertext, min_length)
+    keystream = sc.break_fixed_nonce_ctr(cyphertexts)
 
     # Unprincipled fix:
     # The first byte of the keystream is guessed wrongly, probably because all lines begin
     # with a capital letter and that is not statistically representative of English.
     # So I'm just replacing that byte with the correct one.
-    keystream = sc.xor_buffers_nonrepeating(composite_cyphertext, b"I") + keystream[1:]
+    keystream = sc.xor_buffers_nonrepeating(cyphertexts[0], b"I") + keystream[1:]
 
     decrypted_texts = [sc.xor_buffers_nonrepeating(keystream, text) for text in cyphertexts]
     trucated_plaintexts = [plaintext[:min_length] for plaintext in plaintexts]
@@ -0,0 +1,90 @@
+import base64
+
+import hypothesis as hyp
+import pytest
+
+import block_crypt as bc
+import ecb_scan
+from . import strategies
+
+
+def _write(tmp_path, content):
+    file_name = tmp_path / "corpus"
+    file_name.write_bytes(content)
+    return str(file_name)
+
+
+def _records():
+    key = b"YELLOW SUBMARINE"
+    iv = bytes(16)
+    return [
+        bc.cbc_encrypt(key, iv, bytes(64)),
+        bc.ecb_encrypt(key, bytes(64)),
+        bc.cbc_encrypt(key, iv, bytes(40)),
+        bc.ecb_encrypt(key, bytes(range(16)) * 2 + bytes(32)),
+    ]
+
+
+@hyp.given(blob=strategies.binary(max_size=200))
+def test_repeated_blocks_agree_with_detection(blob):
+    assert (bool(ecb_scan.repeated_blocks(blob))
+            == bc.detect_potential_repeating_ecb_blocks(blob))
+
+
+def test_repeated_blocks_offsets():
+    blob = b"A" * 16 + b"B" * 16 + b"A" * 16 + b"B" * 16 + b"A" * 16
+    assert ecb_scan.repeated_blocks(blob) == ((0, 32, 64), (16, 48))
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_scan_hex(tmp_path, workers):
+    records = _records()
+    file_name = _write(tmp_path, b"\n".join(
+        record.hex().encode() for record in records) + b"\n")
+    candidates = ecb_scan.scan_ecb_corpus(file_name, workers=workers)
+    assert [candidate.record for candidate in candidates] == [1, 3]
+    assert candidates[0].repeats == 3
+    assert candidates[0].block_offsets == ((0, 16, 32, 48),)
+    assert candidates[1].file_offset == 2 * (80 + 80 + 48) + 3
+    assert candidates[1].block_offsets == ((0, 16), (32, 48))
+
+
+def test_scan_base64(tmp_path):
+    file_name = _write(tmp_path, b"\r\n".join(
+        base64.b64encode(record) for record in _records()))
+    candidates = ecb_scan.scan_ecb_corpus(file_name, "base64")
+    assert [candidate.record for candidate in candidates] == [1, 3]
+
+
+@pytest.mark.parametrize("workers", [None, 3])
+def test_scan_raw(tmp_path, workers):
+    records = [record[:48] for record in _records()]
+    file_name = _write(tmp_path, b"".join(records))
+    candidates = ecb_scan.scan_ecb_corpus(
+        file_name, "raw", record_size=48, workers=workers)
+    assert [(candidate.record, candidate.file_offset)
+            for candidate in candidates] == [(1, 48), (3, 144)]
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_scan_skips_bad_and_blank_lines(tmp_path, workers):
+    lines = [record.hex().encode() for record in _records()]
+    lines[1:1] = [b"", b"not hex", b"  "]
+    file_name = _write(tmp_path, b"\n".join(lines) + b"\n")
+    bad_lines = []
+    candidates = ecb_scan.scan_ecb_corpus(
+        file_name, workers=workers, on_bad_line=bad_lines.append)
+    assert [candidate.record for candidate in candidates] == [1, 3]
+    assert bad_lines == [len(lines[0]) + 2]
+
+
+def test_scan_empty(tmp_path):
+    assert ecb_scan.scan_ecb_corpus(_write(tmp_path, b"")) == []
+
+
+def test_scan_bad_arguments(tmp_path):
+    file_name = _write(tmp_path, b"00")
+    with pytest.raises(ValueError):
+        ecb_scan.scan_ecb_corpus(file_name, "rot13")
+    with pytest.raises(ValueError):
+        ecb_scan.scan_ecb_corpus(file_name, "raw")
@@ -81,3 +81,71 @@ class TestEnglishDistance:
 
     def test_different(self):
         assert ed.english_distance("xq\t\0%~".encode()) != 0
+
+    def test_loaded_lazily(self, tmp_path):
+        path = tmp_path / "prototype.txt"
+        comparator = ed._TypeFrequencyPrototypeDistance(prototype_file=path)
+        path.write_bytes(b"eeee")
+        assert comparator(b"") == sqrt(1 / 256)
+        assert comparator(bytearray(b"ee")) == 0
+
+
+class TestScoreMany:
+
+    def test_matches_single_scores(self):
+        texts = [b"bla", b"", "xq\t\0%~".encode(), b"the quick brown fox"]
+        assert ed.english_distance.score_many(texts) == \
+               [ed.english_distance(text) for text in texts]
+
+    def test_packed(self):
+        scores = ed.english_distance.score_many(b"blablobli", width=3)
+        assert scores == ed.english_distance.score_many([b"bla", b"blo", b"bli"])
+
+    def test_empty(self):
+        assert ed.english_distance.score_many([]) == []
+
+
+class TestScorers:
+
+    def test_get_scorer(self):
+        assert ed.get_scorer() is ed.english_distance
+        assert ed.get_scorer("rms") is ed.english_distance
+        with pytest.raises(ValueError):
+            ed.get_scorer("no such scorer")
+
+    def test_function_scorer(self):
+        scorer = ed.get_scorer(len)
+        assert scorer(b"bla") == 3
+        assert scorer.score_many([b"bla", b""]) == [3, 0]
+        assert scorer.single_byte_xor_distances(b"bla") == [3] * 256
+
+    def test_register(self):
+        ed.register_scorer("test_length", ed.get_scorer(len))
+        try:
+            assert ed.get_scorer("test_length")(b"bla") == 3
+        finally:
+            del ed.SCORERS["test_length"]
+
+    @pytest.mark.parametrize("name", sorted(ed.SCORERS))
+    def test_english_beats_noise(self, name):
+        scorer = ed.get_scorer(name)
+        english = b"It was the best of times, it was the worst of times"
+        assert scorer(english) < scorer(b"\x8fq\x12Zx\x03\xf0jjQ!\x7f\x00" * 4)
+
+    @pytest.mark.parametrize("name", sorted(ed.SCORERS))
+    def test_xor_distances_match_decryptions(self, name):
+        scorer = ed.get_scorer(name)
+        blob = b"Cooking MC's like a pound of bacon"
+        decryptions = [bytes(byte ^ key for byte in blob) for key in range(256)]
+        assert scorer.single_byte_xor_distances(blob) == \
+               pytest.approx(scorer.score_many(decryptions))
+
+    def test_ngram_too_short(self):
+        scorer = ed.get_scorer("trigram")
+        assert scorer(b"ab") == scorer(b"")
+        assert scorer(b"the") < scorer(b"ab")
+
+    def test_chi_squared_prefers_prototype(self):
+        scorer = ed._ChiSquaredDistance(b"eeea")
+        assert scorer(b"eeea") < scorer(b"aaae")
+        assert scorer(b"aaae") < scorer(b"xxxx")
@@ -0,0 +1,63 @@
+import io
+
+import hypothesis as hyp
+import pytest
+
+import english_distance as ed
+import frequency_model as fm
+from . import strategies
+
+
+class TestBuildModel:
+
+    def test_empty(self):
+        model = fm.build_model(io.BytesIO(b""), bigrams=True)
+        assert model.corpus_size == 0
+        assert list(model.frequencies) == [0] * 256
+        assert list(model.bigram_frequencies) == [0] * 256 * 256
+
+    @hyp.given(
+        blob=strategies.binary(),
+        chunk_size=strategies.integers(min_value=1, max_value=16)
+    )
+    def test_matches_unchunked(self, blob, chunk_size):
+        model = fm.build_model(io.BytesIO(blob), chunk_size=chunk_size)
+        assert model.corpus_size == len(blob)
+        assert list(model.frequencies) == ed._get_byte_frequencies(blob)
+
+    def test_bigrams_across_chunks(self):
+        model = fm.build_model(io.BytesIO(b"abab"), bigrams=True, chunk_size=1)
+        assert model.bigram_frequencies[(ord("a") << 8) | ord("b")] == 2 / 3
+        assert model.bigram_frequencies[(ord("b") << 8) | ord("a")] == 1 / 3
+
+
+class TestSaveLoad:
+
+    @pytest.mark.parametrize("bigrams", [False, True])
+    def test_roundtrip(self, tmp_path, bigrams):
+        model = fm.build_model(io.BytesIO(b"bla blo bli"), bigrams=bigrams)
+        path = tmp_path / "model.bin"
+        fm.save_model(path, model)
+        assert fm.load_model(path) == model
+
+    def test_not_a_model(self, tmp_path):
+        path = tmp_path / "model.bin"
+        path.write_bytes(bytes(4096))
+        with pytest.raises(ValueError):
+            fm.load_model(path)
+
+    def test_truncated(self, tmp_path):
+        path = tmp_path / "model.bin"
+        fm.save_model(path, fm.build_model(io.BytesIO(b"bla")))
+        path.write_bytes(path.read_bytes()[:-1])
+        with pytest.raises(ValueError):
+            fm.load_model(path)
+
+
+def test_cli_model_scores_like_sample(tmp_path):
+    path = tmp_path / "model.bin"
+    fm._main([ed._ENGLISH_SAMPLE_FILE, str(path)])
+    from_model = ed._TypeFrequencyPrototypeDistance(model_file=path)
+    english = ed.bytes_from_file(ed._ENGLISH_SAMPLE_FILE)
+    assert from_model(english) == 0
+    assert from_model(b"bla") == ed.english_distance(b"bla")
@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import hypothesis as hyp
+import pytest
+
+import block_crypt as bc
+import challenge_specific as cs
+import oracle_tools as ot
+from . import strategies
+
+
+class TestMeteredOracle:
+    def test_memoizes(self):
+        answers = []
+
+        def oracle(blob):
+            answers.append(blob)
+            return blob[::-1]
+
+        metered = ot.MeteredOracle(oracle)
+        assert metered(b"ab") == b"ba"
+        assert metered(bytearray(b"ab")) == b"ba"
+        assert metered(b"cd") == b"dc"
+        assert answers == [b"ab", b"cd"]
+        stats = metered.stats()
+        assert (stats.calls, stats.queries, stats.cache_hits) == (3, 2, 1)
+        assert sum(count for _, count in stats.latency_histogram) == 2
+
+    def test_failed_queries_count(self):
+        def oracle(blob):
+            raise TimeoutError(blob)
+
+        metered = ot.MeteredOracle(oracle)
+        for _ in range(2):
+            with pytest.raises(TimeoutError):
+                metered(b"a")
+        stats = metered.stats()
+        assert (stats.calls, stats.queries, stats.cache_hits) == (2, 2, 0)
+        assert sum(count for _, count in stats.latency_histogram) == 2
+
+    def test_lru_eviction(self):
+        metered = ot.MeteredOracle(len, cache_size=2)
+        for blob in [b"a", b"b", b"a", b"c", b"b"]:
+            metered(blob)
+        # b"b" was evicted by b"c", b"a" was used more recently
+        assert metered.queries == 4
+
+    def test_no_cache(self):
+        metered = ot.MeteredOracle(len, cache_size=0)
+        metered(b"a")
+        metered(b"a")
+        assert metered.queries == 2
+
+    def test_reset(self):
+        metered = ot.MeteredOracle(len)
+        metered(b"a")
+        metered.reset()
+        assert metered.stats() == ot.OracleStats(0, 0, 0, [])
+
+    def test_threads(self):
+        metered = ot.MeteredOracle(len)
+        with ThreadPoolExecutor(4) as executor:
+            list(executor.map(metered, [bytes(ii % 10) for ii in range(200)]))
+        assert metered.calls == 200
+        assert 10 <= metered.queries < 200
+
+    @hyp.settings(deadline=None, max_examples=10)
+    @hyp.given(prefix=strategies.binary(max_size=40),
+               suffix=strategies.binary(max_size=40))
+    def test_challenge_14(self, prefix, suffix):
+        oracle = ot.MeteredOracle(cs.Challenge14Oracle(prefix, suffix))
+        solver = cs.Challenge14Solver(oracle)
+        assert solver.solve() == suffix
+        assert oracle.calls == solver.num_queries
+
+
+class TestMeteredMethods:
+    def test_challenge_17(self):
+        oracle = ot.MeteredMethods(cs.Challenge17Oracle(), ["check_padding"])
+        iv, encrypted = oracle.encrypt_prepadded_input(
+            bc.pad_pkcs_7(b"YELLOW SUBMARINE", 16))
+        assert oracle.check_padding(iv, encrypted)
+        assert oracle.check_padding(iv, encrypted)
+        assert oracle.check_padding.queries == 1
+        assert oracle.queries == 1
+
+    def test_challenge_16(self):
+        oracle = ot.MeteredMethods(
+            cs.Challenge16Oracle(), ["encrypt", "is_admin"])
+        assert oracle.is_admin(cs.challenge_16_forge(oracle))
+        assert oracle.meters["encrypt"].calls == 1
+        assert oracle.queries == 2
+
+    def test_missing_attribute(self):
+        oracle = ot.MeteredMethods(cs.Challenge16Oracle(), [])
+        with pytest.raises(AttributeError):
+            oracle.no_such_method
@@ -3,6 +3,7 @@ import hypothesis.strategies as strat
 import pytest
 
 import primitive_crypt as pc
+import util
 from . import strategies
 
 
@@ -21,6 +22,45 @@ class TestXorBuffers:
         length = len(buf)
         assert pc.xor_buffers(buf, buf) == b"\0" * length
 
+    def test_repeats_shorter(self):
+        assert pc.xor_buffers(b"\x01\x02\x03", b"\x01") == b"\x00\x03\x02"
+        assert pc.xor_buffers(b"\x01", b"\x01\x02\x03") == b"\x00\x03\x02"
+
+    def test_empty(self):
+        with pytest.raises(ValueError):
+            pc.xor_buffers(b"", b"bla")
+
+    @hyp.given(left=strat.binary(min_size=1), right=strat.binary(min_size=1))
+    def test_matches_bytewise(self, left, right):
+        length = max(len(left), len(right))
+        expected = bytes(left[ii % len(left)] ^ right[ii % len(right)]
+                         for ii in range(length))
+        assert pc.xor_buffers(left, right) == expected
+
+    @hyp.given(left=strat.binary(min_size=1), right=strat.binary(min_size=1))
+    def test_buffer_types(self, left, right):
+        expected = pc.xor_buffers(left, right)
+        assert pc.xor_buffers(bytearray(left), memoryview(right)) == expected
+
+
+class TestXorInPlace:
+
+    def test_example(self):
+        buffer = bytearray(b"\x01\x02\x03")
+        pc.xor_in_place(buffer, b"\x01")
+        assert buffer == b"\x00\x03\x02"
+
+    def test_read_only(self):
+        with pytest.raises(TypeError):
+            pc.xor_in_place(b"bla", b"bla")
+
+    @hyp.given(buf=strat.binary(), key=strat.binary(min_size=1))
+    def test_matches_xor_buffers(self, buf, key):
+        hyp.assume(len(buf) >= len(key))
+        buffer = bytearray(buf)
+        pc.xor_in_place(buffer, key)
+        assert buffer == (pc.xor_buffers(buf, key) if buf else b"")
+
 
 class TestXorBuffersNonrepeating:
 
@@ -86,3 +126,63 @@ def test_guess_xor_key_forgiven_size():
     ciphertext = pc.xor_buffers(plaintext, key)
     guessed_key = pc.guess_xor_key_for_given_size(ciphertext, len(key))
     assert guessed_key == key
+
+
+def test_break_single_byte_xor():
+    plaintext = "Cooking MC's like a pound of bacon".encode()
+    ciphertext = pc.xor_buffers(plaintext, b"X")
+    assert pc.break_single_byte_xor(ciphertext) == (b"X", plaintext)
+
+
+def test_find_single_byte_xor():
+    plaintext = "Now that the party is jumping".encode()
+    haystack = [b"\x8a\x13" * 15, pc.xor_buffers(plaintext, b"5"), b"bla"]
+    assert pc.find_single_byte_xor(haystack) == (b"5", plaintext)
+
+
+def test_rank_keysizes():
+    plaintext = util.bytes_from_file("inputs/english_sample.txt")[:600]
+    ciphertext = pc.xor_buffers(plaintext, b"Terminator X")
+    ranked = pc.rank_repeating_xor_keysizes(ciphertext, 20)
+    assert sorted(size for size, _ in ranked) == list(range(1, 20))
+    assert ranked[0][0] == 12
+    scores = [score for _, score in ranked]
+    assert scores == sorted(scores)
+
+
+def test_break_repeating_key_xor_top_k():
+    plaintext = util.bytes_from_file("inputs/english_sample.txt")[:600]
+    ciphertext = pc.xor_buffers(plaintext, b"Terminator X")
+    assert pc.break_repeating_key_xor(ciphertext, 20, top_k=2) == \
+           (b"Terminator X", plaintext)
+
+
+def test_workers_match_serial():
+    plaintext = util.bytes_from_file("inputs/english_sample.txt")[:600]
+    ciphertext = pc.xor_buffers(plaintext, b"Terminator X")
+    assert pc.break_repeating_key_xor(ciphertext, 16, workers=2) == \
+           pc.break_repeating_key_xor(ciphertext, 16)
+    assert pc.guess_xor_key_for_given_size(ciphertext, 12, workers=2) == \
+           b"Terminator X"
+    haystack = [pc.xor_buffers(plaintext[ii:ii + 30], bytes([ii]))
+                for ii in range(20)]
+    assert pc.find_single_byte_xor(haystack, workers=2) == \
+           pc.find_single_byte_xor(haystack)
+
+
+@pytest.mark.parametrize(
+    "scorer", ["rms", "chi_squared", "log_likelihood", "bigram", "trigram"])
+def test_break_single_byte_xor_scorers(scorer):
+    plaintext = "Cooking MC's like a pound of bacon".encode()
+    ciphertext = pc.xor_buffers(plaintext, b"X")
+    assert pc.break_single_byte_xor(ciphertext, scorer=scorer) == \
+           (b"X", plaintext)
+
+
+def test_xor_buffers_out():
+    out = bytearray(4)
+    assert pc.xor_buffers(b"\x01\x02", memoryview(b"\x03\x03\x03\x03"),
+                          out=out) == b"\x02\x01\x02\x01"
+    assert out == b"\x02\x01\x02\x01"
+    assert pc.xor_buffers_nonrepeating(b"\x01\x02", b"\x03", out=out) == \
+           b"\x02"
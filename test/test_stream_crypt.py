@@ -1,7 +1,11 @@
+import base64
+import mmap
+
 import hypothesis as hyp
 import pytest
 
 import stream_crypt as sc
+import util
 from . import strategies
 
 
@@ -24,3 +28,127 @@ def test_ctr_roundtrip(key, nonce, plaintext):
 def test_ctr_nonce_negative(key, nonce, plaintext):
     with pytest.raises(ValueError):
         sc.ctr_transcrypt(key, nonce, plaintext)
+
+
+@pytest.mark.parametrize("scorer", [None, "log_likelihood"])
+def test_break_fixed_nonce_ctr(scorer):
+    b64_lines = util.lines_from_file("inputs/20_inputs.txt")
+    plaintexts = [base64.b64decode(line) for line in b64_lines]
+    key = b"YELLOW SUBMARINE"
+    cyphertexts = [sc.ctr_transcrypt(key, 0, text) for text in plaintexts]
+    keystream = sc.break_fixed_nonce_ctr(cyphertexts, scorer=scorer)
+    min_length = min(len(text) for text in plaintexts)
+    assert len(keystream) == min_length
+    # Position 0 is skipped, line starts are not representative of English
+    assert keystream[1:] == sc.ctr_transcrypt(key, 0, bytes(min_length))[1:]
+
+
+@hyp.given(
+    key=strategies.binary(min_size=16, max_size=16),
+    nonce=strategies.integers(min_value=0, max_value=2 ** 64 - 1),
+    plaintext=strategies.binary(max_size=100),
+    cut=strategies.integers(min_value=0, max_value=100)
+)
+def test_ctr_incremental(key, nonce, plaintext, cut):
+    transcryptor = sc.CtrTranscryptor(key, nonce)
+    encrypted = (transcryptor.update(plaintext[:cut])
+                 + transcryptor.update(plaintext[cut:])
+                 + transcryptor.finalize())
+    assert encrypted == sc.ctr_transcrypt(key, nonce, plaintext)
+
+
+@hyp.given(
+    key=strategies.binary(min_size=16, max_size=16),
+    nonce=strategies.integers(min_value=0, max_value=2 ** 64 - 1),
+    start=strategies.integers(min_value=0, max_value=100),
+    length=strategies.integers(min_value=0, max_value=100)
+)
+def test_ctr_keystream_slice(key, nonce, start, length):
+    keystream = sc.CtrKeystream(key, nonce)
+    num_blocks = (start + length) // 16 + 1
+    expected = b''.join(
+        sc.ctr_keystream(key, nonce, i) for i in range(num_blocks))
+    assert keystream[start:start + length] == expected[start:start + length]
+    assert keystream[start] == expected[start]
+
+
+@hyp.given(
+    key=strategies.binary(min_size=16, max_size=16),
+    nonce=strategies.integers(min_value=0, max_value=2 ** 64 - 1),
+    plaintext=strategies.binary(max_size=100),
+    start=strategies.integers(min_value=0, max_value=100)
+)
+def test_ctr_keystream_transcrypt_range(key, nonce, plaintext, start):
+    encrypted = sc.ctr_transcrypt(key, nonce, plaintext)
+    keystream = sc.CtrKeystream(key, nonce)
+    assert (keystream.transcrypt(encrypted[start:], start)
+            == plaintext[start:])
+
+
+def test_ctr_keystream_end():
+    keystream = sc.CtrKeystream(b"YELLOW SUBMARINE", 0)
+    end = 16 * 2 ** 64
+    assert keystream[end - 16:end] == sc.ctr_keystream(
+        b"YELLOW SUBMARINE", 0, 2 ** 64 - 1)
+    with pytest.raises(ValueError):
+        keystream[end - 16:end + 1]
+    with pytest.raises(IndexError):
+        keystream[end]
+    with pytest.raises(ValueError):
+        keystream[5:]
+
+
+@pytest.mark.parametrize("offset", [0, 7])
+def test_ctr_parallel(offset):
+    key = b"YELLOW SUBMARINE"
+    data = util.random_blob(
+        sc.PARALLEL_MIN_LENGTH + 3, sc.PARALLEL_MIN_LENGTH + 3)
+    keystream = sc.CtrKeystream(key, 1)
+    assert (keystream.transcrypt(data, offset, workers=3)
+            == keystream.transcrypt(data, offset))
+
+
+@hyp.given(
+    messages=strategies.lists(strategies.tuples(
+        strategies.integers(min_value=0, max_value=2 ** 64 - 1),
+        strategies.binary(max_size=50)))
+)
+def test_ctr_transcrypt_many(messages):
+    key = b"YELLOW SUBMARINE"
+    nonces = [nonce for nonce, _ in messages]
+    datas = [data for _, data in messages]
+    assert sc.ctr_transcrypt_many(key, nonces, datas) == [
+        sc.ctr_transcrypt(key, nonce, data) for nonce, data in messages]
+
+
+@hyp.given(
+    data=strategies.binary(max_size=100),
+    offset=strategies.integers(min_value=0, max_value=100)
+)
+def test_ctr_transcrypt_out(data, offset):
+    keystream = sc.CtrKeystream(b"YELLOW SUBMARINE", 3)
+    out = bytearray(100)
+    assert (keystream.transcrypt(memoryview(data), offset, out=out)
+            == keystream.transcrypt(data, offset))
+
+
+@pytest.mark.parametrize("length, workers", [
+    (40, None), (sc.PARALLEL_MIN_LENGTH + 5, 2)])
+def test_ctr_transcrypt_mmap(tmp_path, length, workers):
+    key = b"YELLOW SUBMARINE"
+    data = util.random_blob(length, length)
+    path = tmp_path / "data"
+    path.write_bytes(data)
+    with open(path, "rb") as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as map_:
+        assert sc.ctr_transcrypt(key, 0, map_, workers=workers) == \
+               sc.ctr_transcrypt(key, 0, data)
+        keystream = sc.CtrKeystream(key, 0)
+        assert keystream.transcrypt(map_, 3, workers=workers) == \
+               keystream.transcrypt(data, 3)
+
+
+def test_ctr_transcrypt_many_mismatched_nonces():
+    with pytest.raises(ValueError):
+        sc.ctr_transcrypt_many(
+            b"YELLOW SUBMARINE", [0, 1], [b"abc", b"def", b"ghi"])
@@ -1,3 +1,5 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import hypothesis as hyp
 import hypothesis.strategies as strat
 import pytest
@@ -202,3 +204,92 @@ class TestRandomBlob:
 def test_equal_prefix_length(common, left_extra, right_extra):
     assert util.equal_prefix_length(common + left_extra, common + right_extra) \
            == len(common) + util.equal_prefix_length(left_extra, right_extra)
+
+
+class TestParallelMap:
+    def test_serial(self):
+        assert util.parallel_map(abs, [-1, 2, -3]) == [1, 2, 3]
+
+    def test_workers_keep_order(self):
+        assert util.parallel_map(abs, range(-50, 0), workers=3) == \
+               list(range(50, 0, -1))
+
+    def test_executor(self):
+        with ThreadPoolExecutor(2) as executor:
+            assert util.parallel_map(abs, [-1, -2], workers=executor) == [1, 2]
+
+
+class TestParallelRanges:
+    @staticmethod
+    def _covered(length, **kwargs):
+        ranges = []
+        util.parallel_ranges(
+            lambda start, stop: ranges.append((start, stop)), length, **kwargs)
+        return sorted(ranges)
+
+    def test_serial(self):
+        assert self._covered(100) == [(0, 100)]
+        assert self._covered(100, workers=4, min_parallel_length=101) == \
+               [(0, 100)]
+
+    @hyp.given(length=strat.integers(min_value=0, max_value=1000),
+               workers=strat.integers(min_value=2, max_value=5))
+    def test_ranges_are_aligned_and_cover(self, length, workers):
+        ranges = self._covered(length, workers=workers, alignment=16)
+        assert ranges[0][0] == 0
+        assert ranges[-1][1] == length
+        for (_, stop), (start, _) in zip(ranges, ranges[1:]):
+            assert stop == start
+            assert start % 16 == 0
+
+    def test_executor(self):
+        with ThreadPoolExecutor(2) as executor:
+            assert self._covered(64, workers=executor, alignment=16)[-1] == \
+                   (48, 64)
+
+    def test_errors_propagate(self):
+        def fail(start, stop):
+            raise KeyError(start)
+        with pytest.raises(KeyError):
+            util.parallel_ranges(fail, 100, workers=2)
+
+    @pytest.mark.parametrize("length", [0, 100])
+    def test_process_pool_rejected(self, length):
+        with ProcessPoolExecutor(1) as executor, pytest.raises(TypeError):
+            util.parallel_ranges(lambda start, stop: None, length,
+                                 workers=executor)
+
+
+class TestMatches:
+    @hyp.given(candidates=strat.lists(strat.integers(), max_size=30),
+               workers=strat.sampled_from([None, 1, 3]))
+    def test_like_serial(self, candidates, workers):
+        def predicate(number):
+            return number % 3 == 0
+        expected = [number for number in candidates if predicate(number)]
+        assert util.all_matches(predicate, candidates, workers) == expected
+        assert util.first_match(predicate, candidates, workers) == \
+               (expected[0] if expected else None)
+
+    def test_cancels_after_hit(self):
+        tested = []
+
+        def predicate(number):
+            tested.append(number)
+            return number == 2
+
+        with ThreadPoolExecutor(2) as executor:
+            assert util.first_match(predicate, range(1000), executor,
+                                    max_in_flight=4) == 2
+        assert len(tested) < 10
+
+    def test_errors_propagate(self):
+        with pytest.raises(ZeroDivisionError):
+            util.all_matches(lambda number: 1 / number, [1, 0], workers=2)
+
+    @pytest.mark.parametrize("matches", [util.first_match, util.all_matches])
+    def test_needs_threads(self, matches):
+        with ProcessPoolExecutor(1) as executor, pytest.raises(TypeError):
+            matches(lambda number: number == 2, range(5), executor)
+        with pytest.raises(TypeError):
+            matches(lambda number: number == 2, range(5), "4")
@@ -1,16 +1,27 @@
-__all__ = ["bytes_from_file",
+__all__ = ["all_matches",
+           "bytes_from_file",
+           "check_thread_workers",
            "equal_prefix_length",
            "find_minimal",
+           "first_match",
            "lines_from_file",
            "nonrepeating_zip",
            "obj_from_json_file",
+           "parallel_map",
+           "parallel_ranges",
            "random_blob",
            "repeating_zip",
            "remove_nones",
-           "string_from_file"]
+           "string_from_file",
+           "transform_file"]
 
 import json
 import secrets
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from itertools import islice
 
 
 def bytes_from_file(file_name):
@@ -18,6 +29,24 @@ def bytes_from_file(file_name):
         return file.read()
 
 
+def transform_file(transformer, in_file_name, out_file_name,
+                   chunk_size=1 << 20):
+    """
+    Stream a file through an object with update(chunk) and finalize()
+
+    Such as the incremental ciphers in block_crypt and stream_crypt. Memory
+    use is bounded by the chunk size.
+    """
+    with open(in_file_name, "br") as in_file, \
+            open(out_file_name, "bw") as out_file:
+        while True:
+            chunk = in_file.read(chunk_size)
+            if not chunk:
+                break
+            out_file.write(transformer.update(chunk))
+        out_file.write(transformer.finalize())
+
+
 def string_from_file(file_name):
     return bytes_from_file(file_name).decode()
 
@@ -65,6 +94,157 @@ def find_minimal(gen, criterion):
     return best
 
 
+def parallel_map(function, iterable, workers=None):
+    """
+    List of function applied to each item, optionally in a process pool
+
+    :param workers: None or 1 for a plain serial map, a number of worker
+    processes, or an existing concurrent.futures.Executor to submit to.
+    function and the items must be picklable unless running serially.
+    """
+    items = list(iterable)
+    if isinstance(workers, Executor):
+        return list(workers.map(
+            function, items, chunksize=_chunksize(len(items), 4)))
+    if workers is None or workers <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Few large chunks rather than one round trip per item
+        return list(executor.map(
+            function, items, chunksize=_chunksize(len(items), workers)))
+
+
+def _chunksize(num_items, workers):
+    return max(1, num_items // (4 * workers))
+
+
+def check_thread_workers(workers):
+    """
+    Raise TypeError unless workers is None, a number of threads or a
+    ThreadPoolExecutor
+
+    For functions whose workers share memory with the caller, e.g. write
+    into one buffer, so they can't be processes like in parallel_map.
+    """
+    if workers is None or isinstance(workers, ThreadPoolExecutor):
+        return
+    if not isinstance(workers, int) or isinstance(workers, bool):
+        raise TypeError(
+            "workers must be a number of threads or a ThreadPoolExecutor, "
+            "not {}".format(type(workers).__name__))
+
+
+def parallel_ranges(function, length, workers=None, alignment=1,
+                    min_parallel_length=0):
+    """
+    Call function(start, stop) for consecutive ranges covering length,
+    optionally in a thread pool
+
+    Meant for functions that release the GIL and write into a shared,
+    preallocated buffer, so nothing has to be pickled or copied.
+
+    :param workers: None or 1 for a single call over everything, a number
+    of worker threads, or an existing ThreadPoolExecutor. Unlike in
+    parallel_map, workers are always threads, see check_thread_workers.
+    :param alignment: Every range but the last has a multiple of this length
+    :param min_parallel_length: Shorter lengths get a single call
+    """
+    check_thread_workers(workers)
+    serial = workers is None or (
+        not isinstance(workers, Executor) and workers <= 1)
+    if serial or length == 0 or length < min_parallel_length:
+        function(0, length)
+        return
+    num_workers = 4 if isinstance(workers, Executor) else workers
+    chunk_size = _chunksize(length, num_workers)
+    chunk_size = max(alignment, chunk_size - chunk_size % alignment)
+    ranges = [(start, min(start + chunk_size, length))
+              for start in range(0, length, chunk_size)]
+    if isinstance(workers, Executor):
+        _wait_for_ranges(workers, function, ranges)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        _wait_for_ranges(executor, function, ranges)
+
+
+def _wait_for_ranges(executor, function, ranges):
+    futures = [executor.submit(function, start, stop)
+               for start, stop in ranges]
+    for future in futures:
+        future.result()
+
+
+def first_match(predicate, candidates, workers=None, max_in_flight=None):
+    """
+    First of the candidates, in their order, that predicate is true for, or
+    None if there is none
+
+    :param workers: None or 1 to test one candidate after the other, or a
+    number of threads or a ThreadPoolExecutor to test several at once, see
+    check_thread_workers. Meant for predicates that mostly wait, e.g. on a
+    remote oracle. The result is the same either way; candidates still
+    queued after a hit are cancelled.
+    :param max_in_flight: Candidates being tested at the same time, by
+    default the number of threads, or 16 for a ThreadPoolExecutor
+    """
+    check_thread_workers(workers)
+    with closing(_predicate_results(
+            predicate, candidates, workers, max_in_flight)) as results:
+        for candidate, matches in results:
+            if matches:
+                return candidate
+    return None
+
+
+def all_matches(predicate, candidates, workers=None, max_in_flight=None):
+    """
+    List of the candidates that predicate is true for, in their order
+
+    :param workers, max_in_flight: See first_match
+    """
+    check_thread_workers(workers)
+    return [candidate for candidate, matches in _predicate_results(
+                predicate, candidates, workers, max_in_flight)
+            if matches]
+
+
+def _predicate_results(predicate, candidates, workers, max_in_flight):
+    """Generate candidate, predicate(candidate) pairs in candidate order"""
+    if isinstance(workers, Executor):
+        yield from _ordered_results(
+            predicate, candidates, workers, max_in_flight or 16)
+    elif workers is None or workers <= 1:
+        for candidate in candidates:
+            yield candidate, predicate(candidate)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield from _ordered_results(
+                predicate, candidates, executor, max_in_flight or workers)
+
+
+def _ordered_results(predicate, candidates, executor, max_in_flight):
+    candidates = iter(candidates)
+    in_flight = deque()
+
+    def submit(num_candidates):
+        for candidate in islice(candidates, num_candidates):
+            in_flight.append(
+                (candidate, executor.submit(predicate, candidate)))
+
+    try:
+        submit(max_in_flight)
+        while in_flight:
+            # Waiting for the oldest keeps the order, while the others and
+            # its replacement are in flight
+            candidate, future = in_flight.popleft()
+            matches = future.result()
+            submit(1)
+            yield candidate, matches
+    finally:
+        for _, future in in_flight:
+            future.cancel()
+
+
 # noinspection PyPep8Naming
 class remove_nones:
     def __init__(self, gen):